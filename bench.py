@@ -0,0 +1,260 @@
+# ================== 离线压测: 本地假上游 + 假频道 ==================
+# 用法: python bench.py --events 40 --rows 800 --guilds 200 --latency-ms 80 --iterations 5 --glossary-miss-rate 0.25
+# 所有上游 (FMP / Nasdaq / GitHub / Google 翻译) 都由本地 aiohttp 服务模拟, 不访问外网
+import argparse
+import asyncio
+import datetime
+import itertools
+import math
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+import main
+
+INDICATORS = [
+    "CPI", "Core CPI", "PPI", "Core PPI", "Retail Sales", "Core Retail Sales", "Industrial Production",
+    "Existing Home Sales", "New Home Sales", "Pending Home Sales", "Durable Goods Orders",
+    "Factory Orders", "Import Prices", "Export Prices", "PCE Price Index", "Core PCE Price Index",
+    "Personal Income", "Personal Spending", "Housing Starts", "Building Permits",
+]
+VARIANTS = ["MoM", "YoY", "Final", "Prel"]
+FIXED_TITLES = [
+    "Initial Jobless Claims", "Continuing Jobless Claims", "ISM Manufacturing PMI", "ISM Services PMI",
+    "Nonfarm Payrolls", "Unemployment Rate", "Crude Oil Inventories", "Fed Chair Powell Speech",
+    "Fed Waller Speech", "4-Week Bill Auction", "13-Week Bill Auction", "10-Year Note Auction",
+    "Michigan Consumer Sentiment", "JOLTs Job Openings", "GDP Growth Rate QoQ",
+]
+VALUES = ["0.3%", "-0.1%", "2.9%", "250K", "-1.2B", "52.4", "4.1%", "1.234M", "", "218K", "3.75%"]
+TIMES = ["time-pre-market", "time-after-hours", "time-not-supplied"]
+
+def event_titles(n, miss_rate=0.0):
+    combos = FIXED_TITLES + [f"{ind} {var}" for ind, var in itertools.product(INDICATORS, VARIANTS)]
+    titles = combos[:n]
+    week = 1
+    while len(titles) < n:
+        titles += [f"{t} W{week}" for t in combos[:n - len(titles)]]
+        week += 1
+    # 一部分标题加上术语表里没有的后缀, 保证 Google 翻译这条路径也被压测到
+    rng = random.Random(11)
+    return [f"{t} Ex Seasonal" if rng.random() < miss_rate else t for t in titles]
+
+def universe(n):
+    syms = ["".join(p) for p in itertools.product(string.ascii_uppercase, repeat=3)]
+    return syms[:n]
+
+class FakeUpstreams:
+    def __init__(self, args, date_str):
+        self.args = args
+        self.date_str = date_str
+        self.calls = {'fmp': 0, 'nasdaq': 0, 'github': 0, 'translate': 0, 'translate_segments': 0}
+        self.universe = universe(args.sp500)
+        self.runner = None
+        self.base = None
+
+    async def _delay(self):
+        if self.args.latency_ms:
+            jitter = random.uniform(0, self.args.jitter_ms) if self.args.jitter_ms else 0
+            await asyncio.sleep((self.args.latency_ms + jitter) / 1000)
+
+    async def fmp(self, request):
+        self.calls['fmp'] += 1
+        await self._delay()
+        start = datetime.datetime.strptime(request.query.get('from', self.date_str), "%Y-%m-%d")
+        end = datetime.datetime.strptime(request.query.get('to', self.date_str), "%Y-%m-%d")
+        rng = random.Random(7)
+        data = []
+        day = start
+        while day <= end:
+            for i, title in enumerate(event_titles(self.args.events, self.args.glossary_miss_rate)):
+                # BJT 08:00 = UTC 00:00, 事件分布在当天 UTC 00:00-24:00
+                ts = day + datetime.timedelta(minutes=(i * 1440 // max(self.args.events, 1)))
+                data.append({
+                    "date": ts.strftime("%Y-%m-%d %H:%M:%S"),
+                    "country": "US",
+                    "event": title,
+                    "impact": rng.choice(["Low", "Medium", "High"]),
+                    "estimate": rng.choice(VALUES),
+                    "previous": rng.choice(VALUES),
+                    "actual": None,
+                })
+            day += datetime.timedelta(days=1)
+        return web.json_response(data)
+
+    async def nasdaq(self, request):
+        self.calls['nasdaq'] += 1
+        await self._delay()
+        rng = random.Random(request.query.get('date', ''))
+        pool = self.universe + sorted(main.HOT_STOCKS)
+        rows = [{"symbol": rng.choice(pool), "time": rng.choice(TIMES)} for _ in range(self.args.rows)]
+        # 混入一些不在白名单里的小票
+        rows += [{"symbol": f"ZZ{c}", "time": TIMES[0]} for c in string.ascii_uppercase]
+        return web.json_response({"data": {"rows": rows}})
+
+    async def github(self, request):
+        self.calls['github'] += 1
+        await self._delay()
+        body = "Symbol,Security\n" + "\n".join(f"{s},{s} Inc" for s in self.universe) + "\n"
+        return web.Response(text=body, headers={'ETag': '"bench"'})
+
+    async def translate(self, request):
+        self.calls['translate'] += 1
+        await self._delay()
+        payload = await request.json()
+        q = payload.get('q', [])
+        self.calls['translate_segments'] += len(q)
+        return web.json_response({"data": {"translations": [{"translatedText": f"译:{t}"} for t in q]}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/fmp', self.fmp)
+        app.router.add_get('/nasdaq', self.nasdaq)
+        app.router.add_get('/github', self.github)
+        app.router.add_post('/language/translate/v2', self.translate)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def reset(self):
+        for k in self.calls: self.calls[k] = 0
+
+class FakeChannel:
+    def __init__(self, cid, latency_ms):
+        self.id = cid
+        self.latency = latency_ms / 1000
+        self.messages = 0
+        self.embeds = 0
+
+    async def send(self, **kwargs):
+        if self.latency: await asyncio.sleep(self.latency)
+        self.messages += 1
+        self.embeds += len(kwargs.get('embeds') or []) + (1 if kwargs.get('embed') else 0)
+
+def install(upstreams, tmpdir, args):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import translate_v2
+
+    main.FMP_KEY = main.FMP_KEY or 'bench'
+    main.FMP_CAL_URL = f"{upstreams.base}/fmp"
+    main.NASDAQ_CAL_URL = f"{upstreams.base}/nasdaq"
+    main.GITHUB_SP500_URL = f"{upstreams.base}/github"
+    main.SP500_CACHE_FILE = os.path.join(tmpdir, 'sp500.json')
+    main.LKG_DIR = os.path.join(tmpdir, 'lkg')
+    main.symbol_index = main.SymbolIndex(os.path.join(tmpdir, 'symbols.json'))
+    main.translate_client = translate_v2.Client(
+        credentials=AnonymousCredentials(), client_options={"api_endpoint": upstreams.base}
+    )
+    main._translate_inited = True
+    main.translation_configured = lambda: True
+    main.global_limiter = main.GlobalRateLimiter(args.global_rate)
+
+    channels = {cid: FakeChannel(cid, args.send_latency_ms) for cid in range(1, args.guilds + 1)}
+    main.bot.get_channel = lambda cid: channels.get(cid)
+    main.settings.clear()
+    for gid in range(1, args.guilds + 1):
+        main.settings[gid] = {'channel_id': gid, 'min_importance': (gid % 3) + 1}
+    return channels
+
+def reset_state(tmpdir, iteration, args):
+    # 每轮都是冷启动: 清空数据缓存 / 账本 / (可选) 翻译缓存
+    main.data_cache = main.DataCache()
+    main.ledger = main.DeliveryLedger(os.path.join(tmpdir, f'ledger_{iteration}.db'))
+    tc_path = os.path.join(tmpdir, 'translations.db' if args.warm_translations else f'translations_{iteration}.db')
+    main.translation_cache = main.TranslationCache(tc_path)
+    main.sp500_symbols = set()
+    main.sp500_meta = {}
+
+def pct(values, p):
+    if not values: return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+async def timed(samples, name, coro):
+    t0 = time.perf_counter()
+    result = await coro
+    samples.setdefault(name, []).append(time.perf_counter() - t0)
+    return result
+
+async def run(args):
+    date_str = args.date or datetime.datetime.now(main.BJT).strftime("%Y-%m-%d")
+    upstreams = FakeUpstreams(args, date_str)
+    await upstreams.start()
+    samples = {}
+    calls = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        channels = install(upstreams, tmpdir, args)
+        gids = list(main.settings)
+        try:
+            for i in range(args.iterations):
+                reset_state(tmpdir, i, args)
+                upstreams.reset()
+
+                # 单阶段耗时 (冷缓存)
+                evts = await timed(samples, 'fetch_us_events', main.fetch_us_events(date_str, 1))
+                stocks = await timed(samples, 'fetch_earnings', main.fetch_earnings(date_str))
+                t0 = time.perf_counter()
+                main.format_calendar_embed(evts, date_str, 1)
+                samples.setdefault('format_calendar_embed', []).append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                main.format_earnings_embed(stocks, date_str)
+                samples.setdefault('format_earnings_embed', []).append(time.perf_counter() - t0)
+
+                # 端到端: 清缓存后走一次完整的定时推送 (抓取 + 翻译 + 渲染 + 分发)
+                reset_state(tmpdir, f"{i}_e2e", args)
+                stage_calls = dict(upstreams.calls)
+                await timed(samples, 'push_events (e2e)', main.deliver('evt', date_str, gids))
+                await timed(samples, 'push_earnings (e2e)', main.deliver('ern', date_str, gids))
+                calls.append({k: upstreams.calls[k] - stage_calls[k] for k in upstreams.calls})
+        finally:
+            await main.http_pool.close()
+            await upstreams.stop()
+
+    messages = sum(ch.messages for ch in channels.values())
+    embeds = sum(ch.embeds for ch in channels.values())
+    lines = [
+        f"events={args.events} rows={args.rows} guilds={args.guilds} latency={args.latency_ms}ms "
+        f"send_latency={args.send_latency_ms}ms iterations={args.iterations}",
+        f"{'stage':<24}{'p50 (ms)':>12}{'p95 (ms)':>12}{'max (ms)':>12}",
+    ]
+    for name, vals in samples.items():
+        lines.append(f"{name:<24}{pct(vals, 50) * 1000:>12.1f}{pct(vals, 95) * 1000:>12.1f}{max(vals) * 1000:>12.1f}")
+    lines.append("upstream calls per end-to-end push (avg): " + ", ".join(
+        f"{k}={statistics.mean(c[k] for c in calls):.1f}" for k in calls[0]
+    ))
+    lines.append(f"discord: {messages / args.iterations:.0f} messages / {embeds / args.iterations:.0f} embeds per push round")
+    lines.append("pipeline metrics:")
+    lines += [f"  {line}" for line in main.metrics.summary()]
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="离线推送压测")
+    p.add_argument('--events', type=int, default=40, help="FMP 每天返回的事件数")
+    p.add_argument('--rows', type=int, default=800, help="Nasdaq 返回的财报行数")
+    p.add_argument('--sp500', type=int, default=503, help="假 S&P 500 名单长度")
+    p.add_argument('--guilds', type=int, default=100)
+    p.add_argument('--iterations', type=int, default=5)
+    p.add_argument('--latency-ms', type=float, default=50, help="每个上游请求注入的延迟")
+    p.add_argument('--jitter-ms', type=float, default=0)
+    p.add_argument('--send-latency-ms', type=float, default=20, help="假频道每次 send 的延迟")
+    p.add_argument('--global-rate', type=float, default=main.GLOBAL_RATE_PER_SEC)
+    p.add_argument('--warm-translations', action='store_true', help="各轮共享翻译缓存")
+    p.add_argument('--glossary-miss-rate', type=float, default=0.25, help="本地术语表匹配不上、需要走 Google 的标题比例")
+    p.add_argument('--date', default=None)
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(line_buffering=True)
+    print(asyncio.run(run(parse_args())))
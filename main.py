@@ -1,5 +1,5 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import aiohttp
 import datetime
 import pytz
@@ -7,21 +7,81 @@ import json
 import os
 import re
 import asyncio
+import csv
+import fcntl
+import hashlib
+import glob
+import io
+import heapq
+import itertools
+import random
 import sys
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from aiohttp import web
 from curl_cffi.requests import AsyncSession 
-from google.cloud import translate_v2 as translate
-from google.oauth2 import service_account
 
 # ================== 1. 系统配置 ==================
 sys.stdout.reconfigure(line_buffering=True)
 
 TOKEN = os.getenv('TOKEN')
 FMP_KEY = os.getenv('FMP_KEY') 
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 = 关闭本地指标端口
+# 分片: SHARD_COUNT=总分片数; SHARD_IDS=本进程负责的分片, 如 "0,1" 或 "0-3" (不填则负责全部)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = os.getenv('SHARD_IDS', '')
+SHARED_CACHE_DIR = '/data/cache'
+
+def parse_shard_ids(spec):
+    ids = []
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        if '-' in part:
+            lo, hi = map(int, part.split('-'))
+            ids.extend(range(lo, hi + 1))
+        else:
+            ids.append(int(part))
+    return sorted(set(ids)) or None
+
+SHARD_ID_LIST = parse_shard_ids(SHARD_IDS) if SHARD_COUNT else None
+if SHARD_ID_LIST and METRICS_PORT: METRICS_PORT += SHARD_ID_LIST[0]  # 多进程时各自占一个端口
+
+def owns_guild(gid):
+    # Discord 分片规则: (guild_id >> 22) % shard_count
+    if not SHARD_COUNT or not SHARD_ID_LIST: return True
+    return (int(gid) >> 22) % SHARD_COUNT in SHARD_ID_LIST
 SETTINGS_FILE = '/data/settings.json' 
+TRANSLATION_DB = '/data/translations.db'
+LEDGER_DB = '/data/deliveries.db'
+SP500_CACHE_FILE = '/data/sp500.json'
+COMMANDS_HASH_FILE = '/data/commands.sha256'
+LKG_DIR = '/data/lkg'
+SYMBOL_INDEX_FILE = '/data/symbols.json'
+
+class CalendarBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        # 本地状态在连上网关前就加载好, on_ready 里只做调度
+        load_settings()
+        load_sp500_cache()
+        symbol_index.load()
+        await http_pool.start()
+        await start_metrics_server()
+        self._lag_task = asyncio.create_task(loop_lag_watchdog())
+
+    async def close(self):
+        await stop_metrics_server()
+        await http_pool.close()
+        await super().close()
+        # 等待排队中的写盘完成
+        await asyncio.to_thread(io_executor.shutdown, True)
 
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+shard_kwargs = {'shard_count': SHARD_COUNT, 'shard_ids': SHARD_ID_LIST} if SHARD_COUNT else {}
+bot = CalendarBot(command_prefix='!', intents=intents, **shard_kwargs)
 
 # 时区
 ET = pytz.timezone('America/New_York')
@@ -75,6 +135,31 @@ HOT_STOCKS = {
 
 FALLBACK_GIANTS = {"NVDA", "AAPL", "MSFT", "AMZN", "TSLA", "GOOG", "META"}
 
+# 财报时段初始值 (原手工维护的盘前/盘后名单), 仅在没有 /data/symbols.json 时写入一次, 之后由 Nasdaq 历史接管
+TIMING_SEED = {
+    # --- ☀️ 盘前 ---
+    "BABA": "bmo", "JD": "bmo", "BIDU": "bmo", "PDD": "bmo", "NIO": "bmo", "LI": "bmo", "XPEV": "bmo", "BILI": "bmo", "FUTU": "bmo", "TIGR": "bmo", "YUMC": "bmo", "LKNCY": "bmo",
+    "TSM": "bmo", "ASML": "bmo",
+    "ADI": "bmo", "BBY": "bmo", "SJM": "bmo", "LOW": "bmo", "TGT": "bmo", "MCD": "bmo", "MCK": "bmo", "EMR": "bmo", "JCI": "bmo", "SRE": "bmo", "ALL": "bmo", "MET": "bmo",
+    "ONON": "bmo", "CELH": "bmo", "KVUE": "bmo", "CHWY": "bmo", "LUNR": "bmo",
+    "CCJ": "bmo", "LEU": "bmo", "NXE": "bmo", "TLN": "bmo", "VST": "bmo", "CEG": "bmo", "NEE": "bmo", "SO": "bmo", "NRG": "bmo", "GEV": "bmo", "PLUG": "bmo",
+    "DDOG": "bmo", "SHOP": "bmo", "DKNG": "bmo",
+
+    # --- 🌙 盘后 ---
+    "NVDA": "amc", "AMD": "amc", "INTC": "amc", "AAPL": "amc", "MSFT": "amc", "GOOG": "amc", 
+    "AMZN": "amc", "META": "amc", "TSLA": "amc", "NFLX": "amc",
+    "QCOM": "amc", "ARM": "amc", "AVGO": "amc", "MU": "amc", "SMCI": "amc", "MRVL": "amc", "AMKR": "amc", "ALAB": "amc", "TEM": "amc",
+    "CRWD": "amc", "PANW": "amc", "ZS": "amc", "NET": "amc", "SNOW": "amc", "PLTR": "amc", "PATH": "amc", "MDB": "amc", 
+    "TEAM": "amc", "WDAY": "amc", "ADBE": "amc", "CRM": "amc", "U": "amc", "ROKU": "amc", "SQ": "amc", "ZM": "amc",
+    "APP": "amc", "OPEN": "amc", "LMND": "amc", "HIMS": "amc", "DUOL": "amc", "FTNT": "amc", "DASH": "amc",
+    "MSTR": "amc", "COIN": "amc", "HOOD": "amc", "MARA": "amc", "RIOT": "amc", "CLSK": "amc", "BITF": "amc", "HUT": "amc", "IREN": "amc",
+    "GME": "amc", "AMC": "amc", "DJT": "amc", "KOSS": "amc", "BB": "amc", "RDDT": "amc",
+    "RKLB": "amc", "ASTS": "amc", "SPCE": "amc", "AI": "amc", "SOUN": "amc", "BBAI": "amc", "ROOT": "amc", "CVNA": "amc", "UPST": "amc", "AFRM": "amc",
+    "RIVN": "amc", "LCID": "amc", "FSLR": "amc", "ENPH": "amc",
+    "OKLO": "amc", "SMR": "amc", "NNE": "amc", "LBRT": "amc", "UEC": "amc", "BWXT": "amc", "IONQ": "amc", "RGTI": "amc", "QBTS": "amc", "QUBT": "amc",
+    "CAVA": "amc", "SG": "amc", "CART": "amc", "ELF": "amc"
+}
+
 SPEECH_KEYWORDS = ["Speech", "Testimony", "Remarks", "Press Conference", "Hearing"]
 WEEKDAY_MAP = {
     'Monday': '周一', 'Tuesday': '周二', 'Wednesday': '周三', 'Thursday': '周四',
@@ -85,6 +170,7 @@ IMPACT_MAP = {"Low": 1, "Medium": 2, "High": 3}
 # 全局变量
 settings = {}
 sp500_symbols = set() 
+sp500_meta = {}  # etag / last_modified / checked_at
 translate_client = None
 
 # ================== 4. 辅助工具函数 ==================
@@ -97,21 +183,393 @@ def safe_print_error(prefix, error_obj):
         err_str = err_str.replace(FMP_KEY, "******")
     log(f"❌ {prefix}: {err_str}")
 
-# 初始化 Google 翻译
+# === 指标 (Prometheus 文本格式) ===
+class Metrics:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    PREFIX = 'calendar_bot_'
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}
+        self.hists = {}     # (name, labels) -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()  # 翻译在线程池里也会记录
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, le in enumerate(self.BUCKETS):
+                if seconds <= le: h[0][i] += 1
+            h[1] += seconds
+            h[2] += 1
+
+    @contextmanager
+    def stage(self, name):
+        # 记录阶段耗时 / 调用次数 / 异常次数
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('stage_errors_total', stage=name)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - t0, stage=name)
+            self.inc('stage_calls_total', stage=name)
+
+    def quantile(self, name, q, **labels):
+        h = self.hists.get(self._key(name, labels))
+        if not h or not h[2]: return None
+        target = q * h[2]
+        for le, n in zip(self.BUCKETS, h[0]):
+            if n >= target: return le
+        return float('inf')
+
+    @staticmethod
+    def _fmt_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items: return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({k[0] for k in store}):
+                    lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+                    for (n, labels), v in sorted(store.items()):
+                        if n == name: lines.append(f"{self.PREFIX}{name}{self._fmt_labels(labels)} {v}")
+            for name in sorted({k[0] for k in self.hists}):
+                lines.append(f"# TYPE {self.PREFIX}{name} histogram")
+                for (n, labels), (buckets, total, count) in sorted(self.hists.items()):
+                    if n != name: continue
+                    for le, c in zip(self.BUCKETS, buckets):
+                        lines.append(f"{self.PREFIX}{name}_bucket{self._fmt_labels(labels, [('le', le)])} {c}")
+                    lines.append(f"{self.PREFIX}{name}_bucket{self._fmt_labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{self.PREFIX}{name}_sum{self._fmt_labels(labels)} {total:.6f}")
+                    lines.append(f"{self.PREFIX}{name}_count{self._fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # /metrics 命令用: 每阶段一行
+        lines = []
+        for (name, labels), (_, total, count) in sorted(self.hists.items()):
+            if name != 'stage_seconds' or not count: continue
+            stage = dict(labels)['stage']
+            errors = self.counters.get(self._key('stage_errors_total', {'stage': stage}), 0)
+            p95 = self.quantile('stage_seconds', 0.95, stage=stage)
+            lines.append(f"`{stage}` {count} 次 | 均值 {total / count * 1000:.0f}ms | p95 ≤{p95 * 1000:.0f}ms | 失败 {errors}")
+        caches = sorted({dict(labels)['cache'] for (name, labels) in self.counters if name == 'cache_requests_total'})
+        for cache in caches:
+            hit = self.counters.get(self._key('cache_requests_total', {'cache': cache, 'result': 'hit'}), 0)
+            miss = self.counters.get(self._key('cache_requests_total', {'cache': cache, 'result': 'miss'}), 0)
+            lines.append(f"缓存 `{cache}` 命中率 {hit / max(hit + miss, 1):.0%} ({hit}/{hit + miss})")
+        hit = self.counters.get(self._key('glossary_lookups_total', {'result': 'hit'}), 0)
+        fallback = self.counters.get(self._key('glossary_lookups_total', {'result': 'fallback'}), 0)
+        if hit + fallback:
+            lines.append(f"本地术语表 回退 Google {fallback / (hit + fallback):.0%} ({fallback}/{hit + fallback})")
+        for (name, labels), v in sorted(self.gauges.items()):
+            if name == 'items': lines.append(f"`{dict(labels)['kind']}` 最近数量 {v}")
+        return lines
+
+metrics = Metrics()
+_metrics_runner = None
+
+async def start_metrics_server():
+    global _metrics_runner
+    if not METRICS_PORT or _metrics_runner: return
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    _metrics_runner = web.AppRunner(app, access_log=None)
+    await _metrics_runner.setup()
+    try:
+        await web.TCPSite(_metrics_runner, '127.0.0.1', METRICS_PORT).start()
+        log(f"📈 指标端口: http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        safe_print_error("指标端口启动失败", e)
+
+async def stop_metrics_server():
+    global _metrics_runner
+    if _metrics_runner:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+
+# === 共享 HTTP 连接池 (随 Bot 生命周期创建/关闭) ===
+class HttpPool:
+    def __init__(self, limit=100, limit_per_host=8, dns_ttl=300, keepalive=60):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self._aio = None
+        self._curl = None
+
+    async def start(self):
+        self.aio()
+        self.curl()
+        log("✅ HTTP 连接池已创建")
+
+    def aio(self):
+        # FMP / GitHub: keep-alive + DNS 缓存 + 单 host 并发上限
+        if self._aio is None or self._aio.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl, keepalive_timeout=self.keepalive
+            )
+            self._aio = aiohttp.ClientSession(connector=connector)
+        return self._aio
+
+    def curl(self):
+        # Nasdaq: 浏览器指纹会话只建一次, 复用连接
+        if self._curl is None:
+            self._curl = AsyncSession(impersonate="chrome110", max_clients=self.limit_per_host)
+        return self._curl
+
+    async def close(self):
+        if self._aio is not None and not self._aio.closed:
+            await self._aio.close()
+        if self._curl is not None:
+            await self._curl.close()
+        self._aio = None
+        self._curl = None
+
+http_pool = HttpPool()
+
+# === 阻塞操作隔离: 写盘单线程串行, Google 调用独立限流线程池 ===
+TRANSLATE_WORKERS = 4
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_WARN = 0.25
+
+io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='io')
+translate_executor = ThreadPoolExecutor(max_workers=TRANSLATE_WORKERS, thread_name_prefix='translate')
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, fn, *args)
+
+async def run_translate(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(translate_executor, fn, *args)
+
+def atomic_write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class BackgroundWriter:
+    # 同一文件排队期间只保留最新内容, 原子替换写入
+    def __init__(self, executor):
+        self.executor = executor
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def write(self, path, text):
+        # text 也可以是函数, 在写线程里自行完成读-改-写 (需要在文件锁内写盘时用)
+        with self._lock:
+            queued = path in self._pending
+            self._pending[path] = text
+        if not queued:
+            self.executor.submit(self._flush, path)
+
+    def _flush(self, path):
+        with self._lock:
+            text = self._pending.pop(path)
+        try:
+            if callable(text): text()
+            else: atomic_write(path, text)
+        except Exception as e:
+            log(f"写入失败 {path}: {e}")
+
+writer = BackgroundWriter(io_executor)
+
+async def loop_lag_watchdog():
+    # 定时 sleep, 实际醒来时间与预期之差即事件循环被阻塞的时长
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = time.perf_counter() - t0 - LOOP_LAG_INTERVAL
+        metrics.observe('loop_lag_seconds', max(lag, 0))
+        if lag > LOOP_LAG_WARN:
+            metrics.inc('loop_stalls_total')
+            log(f"⚠️ 事件循环卡顿 {lag * 1000:.0f}ms")
+
+# === 上游容错: 超时 / 抖动重试 / 对冲请求 / 熔断 / 最后可用数据 ===
+UPSTREAM_POLICIES = {
+    'fmp': {'timeout': 10, 'retries': 2, 'hedge': True},
+    'nasdaq': {'timeout': 15, 'retries': 2, 'hedge': True},
+}
+BREAKER_THRESHOLD = 5      # 连续失败 5 次熔断
+BREAKER_COOLDOWN = 120     # 熔断 2 分钟后放一个试探请求
+HEDGE_MIN_SAMPLES = 20     # 样本够多时才用 p95 作为对冲阈值
+LKG_RETENTION_DAYS = 7
+
+class UpstreamError(Exception):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.probing_since = None  # 半开状态下正在进行的试探请求
+
+    def allow(self):
+        if self.opened_at is None: return True
+        now = time.time()
+        if now - self.opened_at < BREAKER_COOLDOWN: return False
+        # 半开: 冷却结束后只放一个试探请求, 其余继续拒绝; 试探失败会立刻重新熔断
+        # 试探请求被取消 (没走到 success/failure) 时, 超过冷却期再放下一个
+        if self.probing_since is not None and now - self.probing_since < BREAKER_COOLDOWN: return False
+        self.probing_since = now
+        return True
+
+    def success(self):
+        if self.opened_at is not None: log(f"✅ {self.name} 熔断恢复")
+        self.failures = 0
+        self.opened_at = None
+        self.probing_since = None
+        metrics.set('circuit_open', 0, endpoint=self.name)
+
+    def failure(self):
+        self.probing_since = None
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            if self.opened_at is None: log(f"⛔ {self.name} 连续失败 {self.failures} 次, 熔断 {BREAKER_COOLDOWN}s")
+            self.opened_at = time.time()
+            metrics.set('circuit_open', 1, endpoint=self.name)
+
+breakers = {name: CircuitBreaker(name) for name in UPSTREAM_POLICIES}
+
+def _hedge_delay(endpoint):
+    stage = f'{endpoint}_fetch'
+    h = metrics.hists.get(metrics._key('stage_seconds', {'stage': stage}))
+    if not h or h[2] < HEDGE_MIN_SAMPLES: return None
+    p95 = metrics.quantile('stage_seconds', 0.95, stage=stage)
+    return p95 if p95 != float('inf') else None
+
+async def _hedged(endpoint, attempt_fn, policy):
+    # 第一个请求超过 p95 还没回来, 再发一个, 取先成功的
+    tasks = [asyncio.ensure_future(asyncio.wait_for(attempt_fn(), policy['timeout']))]
+    try:
+        delay = _hedge_delay(endpoint) if policy.get('hedge') else None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                metrics.inc('hedged_requests_total', endpoint=endpoint)
+                tasks.append(asyncio.ensure_future(asyncio.wait_for(attempt_fn(), policy['timeout'])))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None: return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in tasks:
+            if not t.done(): t.cancel()
+
+def _lkg_path(endpoint, key):
+    # key 可能来自命令参数, 只保留安全字符, 不允许跳出 LKG_DIR
+    return os.path.join(LKG_DIR, f"{endpoint}_{re.sub(r'[^0-9A-Za-z_-]', '-', str(key))}.json")
+
+def load_last_good(endpoint, key):
+    try:
+        with open(_lkg_path(endpoint, key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def prune_last_good(cutoff_ts):
+    # 每个日期 / 日期段一个文件, 定期清理过期的
+    if not os.path.isdir(LKG_DIR): return
+    for name in os.listdir(LKG_DIR):
+        path = os.path.join(LKG_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff_ts: os.remove(path)
+        except OSError: pass
+
+async def resilient_fetch(endpoint, key, attempt_fn):
+    # 返回 (data, stale_at); stale_at 非空表示上游不可用, 返回的是最后一次成功的数据
+    policy = UPSTREAM_POLICIES[endpoint]
+    breaker = breakers[endpoint]
+    error = UpstreamError(f"{endpoint} 熔断中")
+    for attempt in range(policy['retries'] + 1):
+        if not breaker.allow(): break
+        try:
+            data = await _hedged(endpoint, attempt_fn, policy)
+            breaker.success()
+            # 先序列化再交给写线程, 调用方随后会修改 data
+            writer.write(_lkg_path(endpoint, key), json.dumps({'saved_at': time.time(), 'data': data}, ensure_ascii=False))
+            return data, None
+        except Exception as e:
+            error = e
+            breaker.failure()
+            metrics.inc('upstream_failures_total', endpoint=endpoint)
+            if attempt < policy['retries']:
+                await asyncio.sleep(min(2 ** attempt, 8) * random.uniform(0.5, 1.5))
+
+    entry = await run_io(load_last_good, endpoint, key)
+    if entry is None: raise error
+    safe_print_error(f"{endpoint} 不可用, 使用 {datetime.datetime.fromtimestamp(entry['saved_at'], BJT).strftime('%m-%d %H:%M')} 的缓存", error)
+    metrics.inc('stale_served_total', endpoint=endpoint)
+    return entry['data'], entry['saved_at']
+
+def stale_note(items):
+    stale_at = max((i.get('_stale_at') for i in items if i.get('_stale_at')), default=None)
+    if not stale_at: return None
+    return f"⚠️ 数据源暂时不可用，以下为 {datetime.datetime.fromtimestamp(stale_at, BJT).strftime('%m-%d %H:%M')} 的缓存数据"
+
+def is_stale(value):
+    if isinstance(value, dict): return any(is_stale(v) for v in value.values())
+    if isinstance(value, list): return any(isinstance(i, dict) and i.get('_stale_at') for i in value)
+    return False
+
+# 初始化 Google 翻译 (首次使用时才创建, 不拖慢启动)
 google_json_str = os.getenv('GOOGLE_JSON_CONTENT') 
 google_key_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-try:
-    if google_json_str:
-        cred_info = json.loads(google_json_str)
-        credentials = service_account.Credentials.from_service_account_info(cred_info)
-        translate_client = translate.Client(credentials=credentials)
-        log('✅ Google Translate SDK (Env) 初始化成功')
-    elif google_key_path and os.path.exists(google_key_path):
-        credentials = service_account.Credentials.from_service_account_file(google_key_path)
-        translate_client = translate.Client(credentials=credentials)
-        log('✅ Google Translate SDK (File) 初始化成功')
-except Exception as e:
-    safe_print_error("SDK 初始化失败", e)
+_translate_lock = threading.Lock()
+_translate_inited = False
+
+def translation_configured():
+    return bool(google_json_str) or bool(google_key_path and os.path.exists(google_key_path))
+
+def get_translate_client():
+    global translate_client, _translate_inited
+    if _translate_inited: return translate_client
+    with _translate_lock:
+        if _translate_inited: return translate_client
+        try:
+            from google.cloud import translate_v2 as translate
+            from google.oauth2 import service_account
+            if google_json_str:
+                cred_info = json.loads(google_json_str)
+                credentials = service_account.Credentials.from_service_account_info(cred_info)
+                translate_client = translate.Client(credentials=credentials)
+                log('✅ Google Translate SDK (Env) 初始化成功')
+            elif google_key_path and os.path.exists(google_key_path):
+                credentials = service_account.Credentials.from_service_account_file(google_key_path)
+                translate_client = translate.Client(credentials=credentials)
+                log('✅ Google Translate SDK (File) 初始化成功')
+        except Exception as e:
+            safe_print_error("SDK 初始化失败", e)
+        _translate_inited = True
+    return translate_client
 
 def load_settings():
     global settings
@@ -119,85 +577,450 @@ def load_settings():
         try:
             with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
                 raw = json.load(f)
-                settings = {int(k): v for k, v in raw.items()}
+                settings = {int(k): v for k, v in raw.items() if owns_guild(k)}
             log(f"已加载设置: {len(settings)} 个服务器")
         except Exception as e:
             log(f"加载设置失败: {e}")
             settings = {}
 
 def save_settings():
+    # 在当前线程拿快照, 写盘交给后台写线程
+    # 多进程分片时只覆盖本进程负责的服务器, 其他分片的设置原样保留
+    owned = {str(gid): json.loads(json.dumps(conf)) for gid, conf in settings.items() if owns_guild(gid)}
+
+    def _merge():
+        # 读-合并-写盘都在文件锁内完成, 否则两个分片可能读到同一份旧文件后互相覆盖
+        os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
+        with open(SETTINGS_FILE + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = {}
+            if os.path.exists(SETTINGS_FILE):
+                with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                    merged = {k: v for k, v in json.load(f).items() if not owns_guild(k)}
+            merged.update(owned)
+            atomic_write(SETTINGS_FILE, json.dumps(merged, indent=4, ensure_ascii=False))
+
     try:
-        os.makedirs('/data', exist_ok=True)
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=4, ensure_ascii=False)
+        writer.write(SETTINGS_FILE, _merge if SHARD_ID_LIST else json.dumps(owned, indent=4, ensure_ascii=False))
     except Exception as e:
         log(f"保存设置失败: {e}")
 
 def clean_title(title):
     return re.sub(r'\s*\([^)]*\)', '', str(title)).strip()
 
-# === 异步翻译函数 ===
+# === 翻译缓存 (内存 LRU + SQLite 持久化) ===
+class TranslationCache:
+    def __init__(self, path, mem_size=4096, max_rows=50000, max_age_days=180):
+        self.path = path
+        self.mem_size = mem_size
+        self.max_rows = max_rows
+        self.max_age = max_age_days * 86400
+        self.mem = OrderedDict()
+        self._db = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, target_lang):
+        # 归一化: 合并空白, 去首尾空格
+        return f"{target_lang}\x00{' '.join(str(text).split())}"
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL, used_at REAL NOT NULL)")
+            self._evict()
+        return self._db
+
+    def _evict(self):
+        # 按时间 + 条数淘汰, 最久未使用的先删
+        db = self._db
+        db.execute("DELETE FROM translations WHERE used_at < ?", (time.time() - self.max_age,))
+        db.execute("DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+        db.commit()
+
+    def _remember(self, key, value):
+        self.mem[key] = value
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.mem_size:
+            self.mem.popitem(last=False)
+
+    def get(self, text, target_lang):
+        key = self.make_key(text, target_lang)
+        with self._lock:
+            if key in self.mem:
+                self.mem.move_to_end(key)
+                metrics.inc('cache_requests_total', cache='translation', result='hit')
+                return self.mem[key]
+            try:
+                db = self._conn()
+                row = db.execute("SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+                if row:
+                    db.execute("UPDATE translations SET used_at = ? WHERE key = ?", (time.time(), key))
+                    db.commit()
+                    self._remember(key, row[0])
+                    metrics.inc('cache_requests_total', cache='translation', result='hit')
+                    return row[0]
+            except Exception as e:
+                safe_print_error("翻译缓存读取失败", e)
+            metrics.inc('cache_requests_total', cache='translation', result='miss')
+            return None
+
+    def put(self, text, target_lang, value):
+        key = self.make_key(text, target_lang)
+        with self._lock:
+            self._remember(key, value)
+            try:
+                db = self._conn()
+                db.execute("INSERT OR REPLACE INTO translations (key, value, used_at) VALUES (?, ?, ?)", (key, value, time.time()))
+                db.commit()
+                self._puts += 1
+                if self._puts % 500 == 0: self._evict()
+            except Exception as e:
+                safe_print_error("翻译缓存写入失败", e)
+
+translation_cache = TranslationCache(TRANSLATION_DB)
+
+# === 异步翻译函数 (批量 + 去重) ===
+TRANSLATE_BATCH_SIZE = 100  # v2 接口单次最多 128 段
+CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+# 数值 / 带单位的数值原样保留: 0.3%, -1.2B, 250K, $1,234.5M
+VALUE_RE = re.compile(r'^[+-]?\$?\d[\d,]*(\.\d+)?\s*[KMBT]?%?$', re.IGNORECASE)
+ABBRS = {a.lower(): a for a in ['CPI', 'PPI', 'GDP', 'FOMC', 'Fed', 'YoY', 'MoM']}
+ABBR_RE = re.compile(r'\b(' + '|'.join(ABBRS) + r')\b', re.IGNORECASE)
+
+def _fix_abbr(t):
+    return ABBR_RE.sub(lambda m: ABBRS[m.group(1).lower()], t).strip()
+
+# === 本地术语表: 常见标题 / 讲话人 / 数值不走网络, 只有匹配不上的才交给 Google ===
+GLOSSARY = {
+    'cpi': 'CPI', 'core cpi': '核心CPI', 'ppi': 'PPI', 'core ppi': '核心PPI',
+    'pce price index': 'PCE物价指数', 'core pce price index': '核心PCE物价指数',
+    'retail sales': '零售销售', 'core retail sales': '核心零售销售', 'retail sales ex autos': '除汽车外零售销售',
+    'industrial production': '工业产出', 'manufacturing production': '制造业产出', 'capacity utilization': '产能利用率',
+    'existing home sales': '成屋销售', 'new home sales': '新屋销售', 'pending home sales': '成屋签约销售',
+    'housing starts': '新屋开工', 'building permits': '营建许可',
+    'durable goods orders': '耐用品订单', 'core durable goods orders': '核心耐用品订单', 'factory orders': '工厂订单',
+    'import prices': '进口物价', 'export prices': '出口物价',
+    'personal income': '个人收入', 'personal spending': '个人支出',
+    'nonfarm payrolls': '非农就业人数', 'adp employment change': 'ADP就业人数', 'unemployment rate': '失业率',
+    'average hourly earnings': '平均时薪', 'initial jobless claims': '初请失业金人数',
+    'continuing jobless claims': '续请失业金人数', 'jobless claims 4-week average': '四周平均初请失业金人数',
+    'jolts job openings': 'JOLTs职位空缺', 'challenger job cuts': '挑战者企业裁员人数',
+    'ism manufacturing pmi': 'ISM制造业PMI', 'ism services pmi': 'ISM服务业PMI',
+    'ism manufacturing prices': 'ISM制造业物价指数', 'ism services prices': 'ISM服务业物价指数',
+    's&p global manufacturing pmi': '标普全球制造业PMI', 's&p global services pmi': '标普全球服务业PMI',
+    's&p global composite pmi': '标普全球综合PMI', 'chicago pmi': '芝加哥PMI',
+    'michigan consumer sentiment': '密歇根大学消费者信心指数', 'cb consumer confidence': '谘商会消费者信心指数',
+    'michigan inflation expectations': '密歇根大学通胀预期',
+    'gdp growth rate': 'GDP', 'gdp price index': 'GDP价格指数', 'trade balance': '贸易帐',
+    'crude oil inventories': 'EIA原油库存', 'api crude oil stock change': 'API原油库存',
+    'natural gas storage': 'EIA天然气库存', 'baker hughes oil rig count': '贝克休斯石油钻井数',
+    'fed interest rate decision': '美联储利率决议', 'interest rate decision': '美联储利率决议',
+    'fomc minutes': 'FOMC会议纪要', 'fomc press conference': 'FOMC新闻发布会',
+    'fomc economic projections': 'FOMC经济预期', 'beige book': '美联储褐皮书',
+    'monthly budget statement': '月度财政预算', 'wholesale inventories': '批发库存',
+    'business inventories': '商业库存', 'ny empire state manufacturing index': '纽约联储制造业指数',
+    'philadelphia fed manufacturing index': '费城联储制造业指数', 'redbook': '红皮书商业零售销售',
+}
+TITLE_SUFFIXES = {
+    'mom': '月率', 'yoy': '年率', 'qoq': '季率', 'final': '终值', 'prel': '初值', 'adv': '初值',
+    'flash': '初值', '2nd est': '修正值', '3rd est': '终值',
+}
+SPEAKERS = {
+    'powell': '鲍威尔', 'jefferson': '杰斐逊', 'bowman': '鲍曼', 'barr': '巴尔', 'cook': '库克',
+    'waller': '沃勒', 'kugler': '库格勒', 'miran': '米兰', 'williams': '威廉姆斯', 'logan': '洛根',
+    'goolsbee': '古尔斯比', 'bostic': '博斯蒂克', 'daly': '戴利', 'harker': '哈克', 'kashkari': '卡什卡利',
+    'musalem': '穆萨莱姆', 'hammack': '哈马克', 'schmid': '施密德', 'barkin': '巴尔金', 'collins': '柯林斯',
+    'mester': '梅斯特', 'paulson': '保尔森',
+}
+# 地区联储主席 (President) 不能译成 "美联储主席", 那是 Chair
+SPEAKER_TITLES = {None: '美联储', 'chair': '美联储主席', 'vice chair': '美联储副主席', 'governor': '美联储理事', 'president': '地区联储主席'}
+SPEECH_KINDS = {'speech': '讲话', 'speaks': '讲话', 'testimony': '证词', 'press conference': '新闻发布会'}
+AUCTION_UNITS = {'week': '周', 'month': '个月', 'year': '年'}
+AUCTION_KINDS = {'bill': '国库券', 'note': '国债', 'bond': '国债', 'tips': '通胀保值国债', 'frn': '浮动利率国债'}
+SPEAKER_RE = re.compile(r'^(?:fed )?(?:(vice chair|chair|governor|president) )?(\w+) (speech|speaks|testimony|press conference)$')
+AUCTION_RE = re.compile(r'^(\d+)-(week|month|year) (bill|note|bond|tips|frn) auction$')
+
+def glossary_translate(text):
+    # 命中返回中文, 否则 None
+    t = ' '.join(text.split())
+    if VALUE_RE.match(t) or CJK_RE.search(t) or t in ('—', '-'): return t
+    key = t.lower()
+    if key in GLOSSARY: return GLOSSARY[key]
+    m = SPEAKER_RE.match(key)
+    if m and m.group(2) in SPEAKERS:
+        return f"{SPEAKER_TITLES[m.group(1)]}{SPEAKERS[m.group(2)]}{SPEECH_KINDS[m.group(3)]}"
+    m = AUCTION_RE.match(key)
+    if m: return f"{m.group(1)}{AUCTION_UNITS[m.group(2)]}期{AUCTION_KINDS[m.group(3)]}拍卖"
+    # <指标> + MoM/YoY/Final/Prel ...
+    suffix = ''
+    while True:
+        for word, zh in TITLE_SUFFIXES.items():
+            if key.endswith(' ' + word):
+                key, suffix = key[:-len(word) - 1], zh + suffix
+                break
+        else: break
+    if suffix and key in GLOSSARY: return GLOSSARY[key] + suffix
+    return None
+
+def resolve_local(texts, target_lang):
+    # 拆成 (本地已解决, 需要 Google 的)
+    result, rest = {}, []
+    for text in texts:
+        local = glossary_translate(text) if target_lang.startswith('zh') else None
+        if local is None:
+            rest.append(text)
+        else:
+            result[text] = local
+    metrics.inc('glossary_lookups_total', len(result), result='hit')
+    metrics.inc('glossary_lookups_total', len(rest), result='fallback')
+    return result, rest
+
+def _translate_batch_sync(texts, target_lang):
+    client = get_translate_client()
+    if not client: return {t: t for t in texts}
+    result = {}
+    pending = []
+    for text in texts:
+        cached = translation_cache.get(text, target_lang)
+        if cached is not None:
+            result[text] = cached
+        else:
+            pending.append(text)
+
+    for i in range(0, len(pending), TRANSLATE_BATCH_SIZE):
+        chunk = pending[i:i + TRANSLATE_BATCH_SIZE]
+        try:
+            with metrics.stage('translate'):
+                resp = client.translate(chunk, source_language='en', target_language=target_lang)
+            metrics.inc('translated_segments_total', len(chunk))
+            for text, item in zip(chunk, resp):
+                t = _fix_abbr(item['translatedText'])
+                translation_cache.put(text, target_lang, t)
+                result[text] = t
+        except Exception as e:
+            safe_print_error("批量翻译失败", e)
+            for text in chunk: result[text] = text
+    return result
+
+async def translate_batch(texts, target_lang='zh'):
+    # 返回 {原文(strip后): 译文}
+    unique = list(dict.fromkeys(str(t).strip() for t in texts if t and str(t).strip()))
+    if not unique: return {}
+    result, rest = resolve_local(unique, target_lang)
+    if not rest: return result
+    if not translation_configured():
+        result.update({t: t for t in rest})
+        return result
+    try:
+        result.update(await run_translate(_translate_batch_sync, rest, target_lang))
+    except Exception as e:
+        safe_print_error("翻译失败", e)
+        result.update({t: t for t in rest})
+    return result
+
 async def translate_finance_text(text, target_lang='zh'):
-    if not text or not translate_client: return str(text).strip()
+    if not text: return str(text).strip()
     text = str(text).strip()
-    if re.match(r'^-?\d+(\.\d+)?%?$', text): return text
-    
+    return (await translate_batch([text], target_lang)).get(text, text)
+
+# ================== 5. 核心逻辑：更新白名单 ==================
+SP500_TTL = 24 * 3600  # 每天最多检查一次 GitHub
+_sp500_task = None
+
+def load_sp500_cache():
+    global sp500_symbols, sp500_meta
+    if not os.path.exists(SP500_CACHE_FILE): return
     try:
-        def _do_translate():
-            if translate_client.detect_language(text)['language'].startswith('zh'):
-                return text
-            result = translate_client.translate(text, source_language='en', target_language=target_lang)
-            return result['translatedText']
+        with open(SP500_CACHE_FILE, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        if raw.get('symbols'):
+            sp500_symbols = set(raw['symbols'])
+            sp500_meta = raw.get('meta', {})
+            log(f"已加载 S&P 500 缓存: {len(sp500_symbols)} 只")
+    except Exception as e:
+        log(f"加载 S&P 500 缓存失败: {e}")
 
-        t = await asyncio.to_thread(_do_translate)
-        
-        for abbr in ['CPI', 'PPI', 'GDP', 'FOMC', 'Fed', 'YoY', 'MoM']:
-            t = re.sub(rf'\b{abbr}\b', abbr, t, flags=re.IGNORECASE)
-        return t.strip()
+def save_sp500_cache():
+    try:
+        writer.write(SP500_CACHE_FILE, json.dumps({'symbols': sorted(sp500_symbols), 'meta': sp500_meta}))
     except Exception as e:
-        return text
+        log(f"保存 S&P 500 缓存失败: {e}")
 
-# ================== 5. 核心逻辑：更新白名单 ==================
-async def update_sp500_list():
+def parse_sp500_csv(text):
+    rows = csv.reader(io.StringIO(text))
+    next(rows, None)
+    return {row[0].strip().replace('.', '-') for row in rows if row and row[0].strip()}
+
+async def update_sp500_list(force=False):
     global sp500_symbols
-    # log("🔄 正在从 GitHub 更新 S&P 500 名单...") # 减少日志噪音，除非你需要
-    async with aiohttp.ClientSession() as session:
+    if not force and sp500_symbols and time.time() - sp500_meta.get('checked_at', 0) < SP500_TTL:
+        return
+    # 条件请求: 名单没变时 GitHub 返回 304, 不重新下载
+    headers = {}
+    if sp500_symbols and sp500_meta.get('etag'): headers['If-None-Match'] = sp500_meta['etag']
+    if sp500_symbols and sp500_meta.get('last_modified'): headers['If-Modified-Since'] = sp500_meta['last_modified']
+    try:
+        with metrics.stage('sp500_refresh'):
+            await _download_sp500(headers)
+    except Exception as e:
+        safe_print_error("更新名单失败", e)
+    metrics.set('items', len(sp500_symbols), kind='sp500_symbols')
+    # 只有完全没有名单时才退回到巨头兜底, 不会把已有名单缩水
+    if not sp500_symbols:
+        sp500_symbols = set(FALLBACK_GIANTS)
+
+async def _download_sp500(headers):
+    global sp500_symbols
+    async with http_pool.aio().get(GITHUB_SP500_URL, headers=headers, timeout=15) as resp:
+        if resp.status == 304:
+            sp500_meta['checked_at'] = time.time()
+            save_sp500_cache()
+        elif resp.status == 200:
+            new_list = parse_sp500_csv(await resp.text())
+            if len(new_list) > 400:
+                sp500_symbols = new_list
+                sp500_meta.update({
+                    'etag': resp.headers.get('ETag'),
+                    'last_modified': resp.headers.get('Last-Modified'),
+                    'checked_at': time.time()
+                })
+                save_sp500_cache()
+                # log(f"✅ S&P 500 更新成功: {len(sp500_symbols)} 只")
+        else:
+            log(f"⚠️ S&P 500 名单返回 {resp.status}, 沿用现有名单")
+            metrics.inc('stage_errors_total', stage='sp500_refresh')
+
+def refresh_sp500_in_background():
+    global _sp500_task
+    if _sp500_task is None or _sp500_task.done():
+        _sp500_task = asyncio.create_task(update_sp500_list())
+
+# === 股票索引: 关注名单 + S&P 500 + 从 Nasdaq 历史学到的盘前/盘后习惯 ===
+NASDAQ_TIME_CODES = {'time-pre-market': 'bmo', 'time-after-hours': 'amc', 'time-not-supplied': 'other'}
+
+def nasdaq_time_code(time_str):
+    code = NASDAQ_TIME_CODES.get(time_str)
+    if code is None:
+        t = str(time_str).lower()
+        code = 'bmo' if 'before' in t or 'open' in t or 'pre' in t else 'amc' if 'after' in t or 'close' in t else 'other'
+        NASDAQ_TIME_CODES[time_str] = code
+    return code
+
+TIMING_DATES_KEPT = 40  # 每只股票保留最近 40 次财报日期 (约 10 年)
+
+class SymbolIndex:
+    # Nasdaq 原始代码 -> (标准代码, 是否热门); 名单变化时重建
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.timing = {}  # 标准代码 -> {'bmo': 次数, 'amc': 次数, 'dates': 已计入的财报日期}
+        self._pending = []  # 上次保存后新学到的 (代码, 时段, 日期)
+        self._universe = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            # 首次启动: 用旧名单作为初始计数, 免得 Nasdaq 未给时段的热门股要等几个季度才学到
+            self.timing = {symbol: {code: 1, 'bmo' if code == 'amc' else 'amc': 0, 'dates': []}
+                           for symbol, code in TIMING_SEED.items()}
+            io_executor.submit(self._merge_write, [], self.timing)
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.timing = json.load(f).get('timing', {})
+            log(f"已加载财报时段历史: {len(self.timing)} 只")
+        except Exception as e:
+            log(f"加载财报时段历史失败: {e}")
+
+    def _rebuild(self):
+        self._universe = sp500_symbols
+        index = {}
+        for symbol in sp500_symbols | HOT_STOCKS:
+            entry = (symbol, symbol in HOT_STOCKS)
+            # BRK-B / BRK.B / BRKB 都能命中
+            for alias in {symbol, symbol.replace('-', '.'), symbol.replace('-', '')}:
+                index[alias] = entry
+        self.index = index
+        metrics.set('items', len(index), kind='symbol_index')
+
+    def lookup(self, raw_symbol):
+        if self._universe is not sp500_symbols: self._rebuild()
+        return self.index.get(str(raw_symbol).strip().upper())
+
+    @staticmethod
+    def _count(timing, symbol, code, date_str):
+        h = timing.setdefault(symbol, {'bmo': 0, 'amc': 0, 'dates': []})
+        last = h.pop('last', '')  # 旧格式只记了最近一天
+        dates = h.setdefault('dates', [last] if last else [])
+        # 按 (代码, 日期) 去重: 缓存重取 / 其他分片已计过 / 来回查询不同日期, 同一份财报都只计一次
+        if date_str in dates: return False
+        h[code] += 1
+        dates.append(date_str)
+        del dates[:-TIMING_DATES_KEPT]
+        return True
+
+    def learn(self, symbol, code, date_str):
+        if not self._count(self.timing, symbol, code, date_str): return False
+        self._pending.append((symbol, code, date_str))
+        return True
+
+    def usual_time(self, symbol):
+        h = self.timing.get(symbol)
+        if not h or h['bmo'] == h['amc']: return 'other'
+        return 'bmo' if h['bmo'] > h['amc'] else 'amc'
+
+    def save(self):
+        pending, self._pending = self._pending, []
+        io_executor.submit(self._merge_write, pending)
+
+    def _merge_write(self, pending, seed=None):
+        # 多进程分片共用一个文件: 加锁后读盘, 只把本进程新学到的计数合并进去, 不覆盖其他分片的
         try:
-            async with session.get(GITHUB_SP500_URL, timeout=15) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    new_list = set()
-                    for line in text.split('\n')[1:]:
-                        parts = line.split(',')
-                        if parts and parts[0]:
-                            new_list.add(parts[0].strip().replace('.', '-'))
-                    
-                    if len(new_list) > 400:
-                        sp500_symbols = new_list
-                        # log(f"✅ S&P 500 更新成功: {len(sp500_symbols)} 只")
-                    else:
-                        sp500_symbols.update(FALLBACK_GIANTS)
-                else:
-                    sp500_symbols.update(FALLBACK_GIANTS)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                timing = {}
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        timing = json.load(f).get('timing', {})
+                for symbol, h in (seed or {}).items():
+                    timing.setdefault(symbol, dict(h))
+                for symbol, code, date_str in pending:
+                    self._count(timing, symbol, code, date_str)
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'timing': timing}, f, sort_keys=True)
+                os.replace(tmp, self.path)
         except Exception as e:
-            safe_print_error("更新名单失败", e)
-            sp500_symbols.update(FALLBACK_GIANTS)
+            log(f"保存财报时段历史失败: {e}")
+
+symbol_index = SymbolIndex(SYMBOL_INDEX_FILE)
 
 # ================== 6. 核心逻辑：宏观日历 (FMP) ==================
 async def fetch_us_events(target_date_str, min_importance=2):
-    try: target_date = datetime.datetime.strptime(target_date_str, "%Y-%m-%d").date()
-    except: return []
-    
-    params = {"from": target_date_str, "to": target_date_str, "apikey": FMP_KEY}
+    return (await fetch_us_events_range(target_date_str, target_date_str, min_importance)).get(target_date_str, [])
+
+async def fetch_us_events_range(start_date_str, end_date_str, min_importance=2):
+    # 一次请求拿整段日期, 按北京时间 08:00 分界归到各天: {date_str: [events]}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(FMP_CAL_URL, params=params, timeout=10) as resp:
+        first = datetime.datetime.strptime(start_date_str, "%Y-%m-%d").date()
+        last = datetime.datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    except: return {}
+    
+    params = {"from": start_date_str, "to": end_date_str, "apikey": FMP_KEY}
+
+    async def _attempt():
+        with metrics.stage('fmp_fetch'):
+            async with http_pool.aio().get(FMP_CAL_URL, params=params, timeout=UPSTREAM_POLICIES['fmp']['timeout']) as resp:
                 resp.raise_for_status()
                 data = await resp.json()
-        
-        events = []
-        start = BJT.localize(datetime.datetime.combine(target_date, datetime.time(8, 0)))
-        end = start + datetime.timedelta(days=1)
+            if not isinstance(data, list): raise UpstreamError(f"FMP 返回异常: {str(data)[:200]}")
+            return data
+
+    try:
+        data, stale_at = await resilient_fetch('fmp', f"{start_date_str}_{end_date_str}", _attempt)
         
         valid_items = []
         for item in data:
@@ -211,44 +1034,63 @@ async def fetch_us_events(target_date_str, min_importance=2):
             try:
                 utc = UTC.localize(datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S"))
                 bjt = utc.astimezone(BJT)
-                if start <= bjt < end:
+                day = (bjt - datetime.timedelta(hours=8)).date()
+                if first <= day <= last:
                     item['_bjt'] = bjt
                     item['_et'] = utc.astimezone(ET)
                     item['_imp'] = imp
+                    item['_day'] = day.strftime("%Y-%m-%d")
                     valid_items.append(item)
             except: continue
 
+        # 整段日期内所有待翻译文本去重后批量翻译, 再回填
+        for item in valid_items:
+            item['_title'] = clean_title(item.get("event", ""))
+            item['_forecast'] = str(item.get("estimate", "") or "—").strip()
+            item['_prev'] = str(item.get("previous", "") or "—").strip()
+            item['_actual'] = str(item.get("actual", "") or "").strip()
+        translated = await translate_batch(
+            [s for item in valid_items for s in (item['_title'], item['_forecast'], item['_prev'], item['_actual'])]
+        )
+
+        by_day = {}
         for item in valid_items:
             bjt = item['_bjt']
             et = item['_et']
             imp = item['_imp']
             
             time_str = f"{bjt.strftime('%H:%M')} ({et.strftime('%H:%M')} ET)"
-            title = clean_title(item.get("event", ""))
+            title = item['_title']
             
-            trans_title = await translate_finance_text(title)
-            trans_forecast = await translate_finance_text(item.get("estimate", "") or "—")
-            trans_prev = await translate_finance_text(item.get("previous", "") or "—")
-            
-            events.append({
+            by_day.setdefault(item['_day'], []).append({
                 "time": time_str,
                 "importance": "★" * imp,
-                "title": trans_title,
-                "forecast": trans_forecast,
-                "previous": trans_prev,
+                "title": translated.get(title, title),
+                "forecast": translated.get(item['_forecast'], item['_forecast']),
+                "previous": translated.get(item['_prev'], item['_prev']),
+                "actual": translated.get(item['_actual'], item['_actual']),
                 "orig_title": title,
-                "bjt_timestamp": bjt
+                "bjt_timestamp": bjt,
+                "_imp": imp,
+                "_stale_at": stale_at
             })
         
-        unique_events = {}
-        for e in events:
-            key = e['title']
-            if key not in unique_events or e['bjt_timestamp'] < unique_events[key]['bjt_timestamp']:
-                unique_events[key] = e
-        return sorted(unique_events.values(), key=lambda x: x["bjt_timestamp"])
+        metrics.set('items', len(valid_items), kind='fmp_events')
+        # 同名事件在按星级过滤后再去重 (filter_events), 这里只排序
+        return {day: sorted(events, key=lambda x: x["bjt_timestamp"]) for day, events in by_day.items()}
     except Exception as e:
         safe_print_error("Events API Error", e)
-        return []
+        return {}
+
+def filter_events(events, min_importance):
+    # 共享结果按服务器星级过滤 (按最低星级抓取一次, 各服务器各取所需)
+    # 过滤后再按标题去重, 保留最早一条 (events 已按时间排序), 与直接按该星级抓取的结果一致
+    seen, result = set(), []
+    for e in events:
+        if e.get('_imp', 1) < min_importance or e['title'] in seen: continue
+        seen.add(e['title'])
+        result.append(e)
+    return result
 
 # ================== 7. 核心逻辑：财报获取 (超级兜底版) ==================
 async def fetch_earnings(date_str):
@@ -266,91 +1108,66 @@ async def fetch_earnings(date_str):
     
     params = {"date": date_str}
 
-    try:
-        async with AsyncSession(impersonate="chrome110") as session:
-            resp = await session.get(NASDAQ_CAL_URL, params=params, headers=headers, timeout=15)
-            
+    async def _attempt():
+        with metrics.stage('nasdaq_fetch'):
+            resp = await http_pool.curl().get(NASDAQ_CAL_URL, params=params, headers=headers, timeout=UPSTREAM_POLICIES['nasdaq']['timeout'])
             if resp.status_code != 200:
-                log(f"❌ Nasdaq API 返回错误: {resp.status_code}")
-                return []
-            
+                raise UpstreamError(f"Nasdaq API 返回错误: {resp.status_code}")
             try:
                 data = resp.json()
             except:
-                log("❌ Nasdaq 返回非 JSON 数据")
-                return []
+                raise UpstreamError("Nasdaq 返回非 JSON 数据")
+        return (data.get('data') or {}).get('rows') or []
 
-            rows = data.get('data', {}).get('rows', [])
-            if not rows:
-                log("⚠️ Nasdaq 返回空数据")
-                return []
+    try:
+        rows, stale_at = await resilient_fetch('nasdaq', date_str, _attempt)
+        metrics.set('items', len(rows), kind='nasdaq_rows')
+        if not rows:
+            log("⚠️ Nasdaq 返回空数据")
+            return []
 
-            important_stocks = []
-            
-            FALLBACK_MAP = {
-                # --- ☀️ 盘前 ---
-                "BABA": 1, "JD": 1, "BIDU": 1, "PDD": 1, "NIO": 1, "LI": 1, "XPEV": 1, "BILI": 1, "FUTU": 1, "TIGR": 1, "YUMC": 1, "LKNCY": 1,
-                "TSM": 1, "ASML": 1,
-                "ADI": 1, "BBY": 1, "SJM": 1, "LOW": 1, "TGT": 1, "MCD": 1, "MCK": 1, "EMR": 1, "JCI": 1, "SRE": 1, "ALL": 1, "MET": 1,
-                "ONON": 1, "CELH": 1, "KVUE": 1, "CHWY": 1, "LUNR": 1,
-                "CCJ": 1, "LEU": 1, "NXE": 1, "TLN": 1, "VST": 1, "CEG": 1, "NEE": 1, "SO": 1, "NRG": 1, "GEV": 1, "PLUG": 1,
-                "DDOG": 1, "SHOP": 1, "DKNG": 1,
-
-                # --- 🌙 盘后 ---
-                "NVDA": 2, "AMD": 2, "INTC": 2, "AAPL": 2, "MSFT": 2, "GOOG": 2, 
-                "AMZN": 2, "META": 2, "TSLA": 2, "NFLX": 2,
-                "QCOM": 2, "ARM": 2, "AVGO": 2, "MU": 2, "SMCI": 2, "MRVL": 2, "AMKR": 2, "ALAB": 2, "TEM": 2,
-                "CRWD": 2, "PANW": 2, "ZS": 2, "NET": 2, "SNOW": 2, "PLTR": 2, "PATH": 2, "MDB": 2, 
-                "TEAM": 2, "WDAY": 2, "ADBE": 2, "CRM": 2, "U": 2, "ROKU": 2, "SQ": 2, "ZM": 2,
-                "APP": 2, "OPEN": 2, "LMND": 2, "HIMS": 2, "DUOL": 2, "FTNT": 2, "DASH": 2,
-                "MSTR": 2, "COIN": 2, "HOOD": 2, "MARA": 2, "RIOT": 2, "CLSK": 2, "BITF": 2, "HUT": 2, "IREN": 2,
-                "GME": 2, "AMC": 2, "DJT": 2, "KOSS": 2, "BB": 2, "RDDT": 2,
-                "RKLB": 2, "ASTS": 2, "SPCE": 2, "AI": 2, "SOUN": 2, "BBAI": 2, "ROOT": 2, "CVNA": 2, "UPST": 2, "AFRM": 2,
-                "RIVN": 2, "LCID": 2, "FSLR": 2, "ENPH": 2,
-                "OKLO": 2, "SMR": 2, "NNE": 2, "LBRT": 2, "UEC": 2, "BWXT": 2, "IONQ": 2, "RGTI": 2, "QBTS": 2, "QUBT": 2,
-                "CAVA": 2, "SG": 2, "CART": 2, "ELF": 2
-            }
-
-            for item in rows:
-                raw_symbol = item.get('symbol')
-                symbol = re.sub(r'[^A-Z]', '', str(raw_symbol).upper())
-                time_str = item.get('time', 'other')
-                
-                is_hot = symbol in HOT_STOCKS
-                is_sp500 = symbol in sp500_symbols
-                
-                if is_hot or is_sp500:
-                    time_code = 'other'
-                    t_lower = time_str.lower()
-                    
-                    if "before" in t_lower or "open" in t_lower: 
-                        time_code = 'bmo'
-                    elif "after" in t_lower or "close" in t_lower: 
-                        time_code = 'amc'
-                    
-                    if time_code == 'other' and symbol in FALLBACK_MAP:
-                        guess = FALLBACK_MAP[symbol]
-                        time_code = 'bmo' if guess == 1 else 'amc'
-
-                    important_stocks.append({
-                        'symbol': symbol,
-                        'time': time_code,
-                        'is_hot': is_hot
-                    })
-            
-            unique_dict = {s['symbol']: s for s in important_stocks}
-            final_list = list(unique_dict.values())
-            final_list.sort(key=lambda x: x['is_hot'], reverse=True)
-            
-            log(f"✅ Nasdaq 获取完成，筛选后剩余 {len(final_list)} 家")
-            return final_list
+        important_stocks = []
+        learned = False
+        for item in rows:
+            hit = symbol_index.lookup(item.get('symbol'))
+            if not hit: continue
+            symbol, is_hot = hit
+            time_code = nasdaq_time_code(item.get('time'))
+            if time_code == 'other':
+                # Nasdaq 没给时段: 用该股历史上的习惯时段
+                time_code = symbol_index.usual_time(symbol)
+            elif not stale_at:
+                learned = symbol_index.learn(symbol, time_code, date_str) or learned
+
+            important_stocks.append({
+                'symbol': symbol,
+                'time': time_code,
+                'is_hot': is_hot,
+                '_stale_at': stale_at
+            })
+        if learned: symbol_index.save()
+        
+        unique_dict = {s['symbol']: s for s in important_stocks}
+        final_list = list(unique_dict.values())
+        final_list.sort(key=lambda x: x['is_hot'], reverse=True)
+        
+        metrics.set('items', len(final_list), kind='earnings_kept')
+        log(f"✅ Nasdaq 获取完成，筛选后剩余 {len(final_list)} 家")
+        return final_list
 
     except Exception as e:
         safe_print_error("Nasdaq API Error", e)
         return []
 
 # ================== 8. 格式化输出 (防截断 + 自动分页) ==================
+def is_speech(e):
+    return any(k in e['orig_title'] for k in SPEECH_KEYWORDS)
+
 def format_calendar_embed(events, date_str, min_imp):
+    with metrics.stage('format_calendar'):
+        return _format_calendar_embed(events, date_str, min_imp)
+
+def _format_calendar_embed(events, date_str, min_imp):
     try:
         dt = datetime.datetime.strptime(date_str, "%Y-%m-%d")
         month_day = dt.strftime("%m月%d日")
@@ -375,15 +1192,22 @@ def format_calendar_embed(events, date_str, min_imp):
         embed = discord.Embed(title=title, color=0x00FF00)
         
         for e in chunk:
-            val = f"影响: {e['importance']}" if any(k in e['orig_title'] for k in SPEECH_KEYWORDS) else \
+            val = f"影响: {e['importance']}" if is_speech(e) else \
                   f"影响: {e['importance']} | 预期: {e['forecast']} | 前值: {e['previous']}"
+            if e.get('actual'): val += f" | 公布: **{e['actual']}**"
             embed.add_field(name=f"{e['time']} {e['title']}", value=val, inline=False)
         
         embeds.append(embed)
-        
+
+    note = stale_note(events)
+    if note: embeds[-1].set_footer(text=note)
     return embeds
 
 def format_earnings_embed(stocks, date_str):
+    with metrics.stage('format_earnings'):
+        return _format_earnings_embed(stocks, date_str)
+
+def _format_earnings_embed(stocks, date_str):
     if not stocks: return None
     
     try:
@@ -424,74 +1248,937 @@ def format_earnings_embed(stocks, date_str):
     if amc: embed.add_field(name="🌙 盘后", value=build_safe_list(amc), inline=False)
     if other: embed.add_field(name="🕒 时间未定", value=build_safe_list(other), inline=False)
 
-    embed.set_footer(text="数据来源: Nasdaq")
+    embed.set_footer(text=stale_note(stocks) or "数据来源: Nasdaq")
     return embed
 
-# ================== 9. 定时任务与事件 ==================
-@tasks.loop(minutes=1)
-async def main_loop():
-    now = datetime.datetime.now(BJT)
-    
-    # === 新增：每 5 分钟打印一次心跳日志 ===
-    if now.minute % 5 == 0:
-        log(f"💓 [系统心跳] Bot 运行正常 | 时间: {now.strftime('%H:%M')}")
-
-    # 08:00 宏观
-    if now.hour == 8 and 0 <= now.minute < 5:
-        today = now.strftime("%Y-%m-%d")
-        lock = f"/data/evt_{today}.lock"
-        if not os.path.exists(lock):
-            with open(lock, "w") as f: f.write("x")
-            log(f"🚀 推送宏观: {today}")
-            for gid, conf in settings.items():
-                ch = bot.get_channel(conf.get('channel_id'))
-                if ch:
-                    evts = await fetch_us_events(today, conf.get('min_importance', 2))
-                    embed_list = format_calendar_embed(evts, today, conf.get('min_importance', 2))
-                    for em in embed_list:
-                        await ch.send(embed=em)
-
-    # 20:00 财报
-    elif now.hour == 20 and 0 <= now.minute < 5:
-        tmr = (now + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        lock = f"/data/ern_{tmr}.lock"
-        if not os.path.exists(lock):
-            with open(lock, "w") as f: f.write("x")
-            await update_sp500_list()
-            log(f"🚀 推送财报: {tmr}")
-            data = await fetch_earnings(tmr)
-            embed = format_earnings_embed(data, tmr)
-            if embed:
-                for gid, conf in settings.items():
-                    ch = bot.get_channel(conf.get('channel_id'))
-                    if ch: await ch.send(embed=embed)
-
-@main_loop.before_loop
-async def before_loop():
-    await bot.wait_until_ready()
+WEEK_EVENTS_PER_DAY = 6
+WEEK_STOCKS_PER_DAY = 12
+
+def format_week_embed(events_by_day, earnings_by_day, date_str):
+    with metrics.stage('format_week'):
+        days = week_days(date_str)
+        first = datetime.datetime.strptime(days[0], "%Y-%m-%d")
+        embed = discord.Embed(title=f"本周前瞻 ({first.strftime('%m月%d日')} 起)", color=0x9b59b6)
+        for day in days:
+            evts = events_by_day.get(day) or []
+            stocks = earnings_by_day.get(day) or []
+            if not evts and not stocks: continue
+            dt = datetime.datetime.strptime(day, "%Y-%m-%d")
+            # 优先展示高星级事件
+            top = sorted(evts, key=lambda e: (-e.get('_imp', 1), e['bjt_timestamp']))[:WEEK_EVENTS_PER_DAY]
+            lines = [f"{e['importance']} {e['time'].split(' ')[0]} {e['title']}" for e in sorted(top, key=lambda e: e['bjt_timestamp'])]
+            if len(evts) > len(top): lines.append(f"...(另有{len(evts) - len(top)}项)")
+            if stocks:
+                names = [f"{'🔥' if s['is_hot'] else ''}{s['symbol']}" for s in stocks[:WEEK_STOCKS_PER_DAY]]
+                more = f" 等{len(stocks)}家" if len(stocks) > WEEK_STOCKS_PER_DAY else ""
+                lines.append(f"财报: {', '.join(names)}{more}")
+            embed.add_field(
+                name=f"{WEEKDAY_MAP.get(dt.strftime('%A'), '')} {dt.strftime('%m/%d')}",
+                value="\n".join(lines)[:1024], inline=False
+            )
+        if not embed.fields: embed.description = "本周无重要事件"
+        items = [i for v in list(events_by_day.values()) + list(earnings_by_day.values()) for i in (v or [])]
+        embed.set_footer(text=stale_note(items) or "数据来源: FMP / Nasdaq")
+        return embed
+
+# === 消息打包 + 渲染结果复用 ===
+MESSAGE_EMBED_LIMIT = 10     # Discord 单条消息最多 10 个 embed
+MESSAGE_CHAR_LIMIT = 6000    # 单条消息所有 embed 字数合计上限
+RENDER_CACHE_SIZE = 32
+
+def pack_embeds(embeds):
+    # 贪心装箱: 按顺序尽量把 embed 塞进同一条消息
+    payloads = []
+    batch, size = [], 0
+    for em in embeds:
+        n = len(em)
+        if batch and (len(batch) >= MESSAGE_EMBED_LIMIT or size + n > MESSAGE_CHAR_LIMIT):
+            payloads.append({'embeds': batch})
+            batch, size = [], 0
+        batch.append(em)
+        size += n
+    if batch: payloads.append({'embeds': batch})
+    return payloads
+
+_render_cache = OrderedDict()
+
+def payload_digest(payload):
+    # 用于判断已发出的消息是否需要编辑
+    raw = json.dumps([em.to_dict() for em in payload['embeds']], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def calendar_payloads(events, date_str, min_imp):
+    # 相同 (日期, 星级, 内容) 只渲染一次, 所有服务器共用
+    events = filter_events(events, min_imp)
+    fingerprint = hash(tuple((e['time'], e['title'], e['forecast'], e['previous'], e.get('actual'), e.get('_imp'), e.get('_stale_at')) for e in events))
+    key = (date_str, min_imp, fingerprint)
+    if key in _render_cache:
+        _render_cache.move_to_end(key)
+        metrics.inc('cache_requests_total', cache='render', result='hit')
+        return _render_cache[key]
+    metrics.inc('cache_requests_total', cache='render', result='miss')
+    payloads = pack_embeds(format_calendar_embed(events, date_str, min_imp))
+    _render_cache[key] = payloads
+    while len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+    return payloads
+
+# ================== 9. 数据预取 (按日期缓存) ==================
+PREFETCH_LEAD = 60 * 60           # 推送前 60 分钟开始预取
+PREFETCH_FINAL_LEAD = 10 * 60     # 推送前 10 分钟检查是否需要刷新
+PREFETCH_REFRESH_AGE = 20 * 60    # 预取数据超过 20 分钟则在推送前刷新
+SERVE_MAX_AGE = 90 * 60           # 推送可直接使用的最大缓存年龄
+COMMAND_CACHE_TTL = 10 * 60       # 斜杠命令的缓存有效期
+EMPTY_RESULT_TTL = 60             # 空结果 (可能是上游抽风) 只缓存 1 分钟
+STALE_RESULT_TTL = 120            # 兜底的旧数据只缓存 2 分钟, 尽快重试上游
+
+def _encode_cached(o):
+    if isinstance(o, datetime.datetime): return {'__dt__': o.isoformat()}
+    raise TypeError(type(o))
+
+def _decode_cached(d):
+    return datetime.datetime.fromisoformat(d['__dt__']) if '__dt__' in d else d
+
+class SharedDiskCache:
+    # 各分片进程共享的抓取结果; 用文件锁保证同一 key 只有一个进程去请求上游
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, '_'.join(str(k) for k in key).replace('/', '-') + '.json')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                raw = json.load(f, object_hook=_decode_cached)
+            return raw['fetched_at'], raw['value']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, key, fetched_at, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'value': value}, f, default=_encode_cached, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def _open_lock(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(self.path(key) + '.lock', 'a')
+
+    async def lock(self, key):
+        fd = await run_io(self._open_lock, key)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                await asyncio.sleep(0.2)
+
+    @staticmethod
+    def unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        fd.close()
+
+    def prune(self, cutoff_ts):
+        if not os.path.isdir(self.directory): return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff_ts: os.remove(path)
+            except OSError: pass
+
+class DataCache:
+    # key: (kind, date, ...) -> (fetched_at, value)
+    def __init__(self, disk=None):
+        self.entries = {}
+        self.inflight = {}
+        self.disk = disk
+
+    def get(self, key, max_age):
+        entry = self.entries.get(key)
+        if not entry: return None
+        age = time.time() - entry[0]
+        if age > max_age: return None
+        if not entry[1] and age > EMPTY_RESULT_TTL: return None
+        if age > STALE_RESULT_TTL and is_stale(entry[1]): return None
+        return entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (time.time(), value)
+        # 只保留最近 7 天的数据 (周索引需要本周已过去的几天)
+        cutoff = (datetime.datetime.now(BJT) - datetime.timedelta(days=7)).strftime("%Y-%m-%d")
+        for k in [k for k in self.entries if k[1] < cutoff]:
+            del self.entries[k]
+
+    async def get_or_fetch(self, key, fetcher, max_age):
+        cached = self.get(key, max_age)
+        metrics.inc('cache_requests_total', cache=key[0], result='miss' if cached is None else 'hit')
+        if cached is not None:
+            return cached
+        # single-flight: 同一 key 的并发调用共享一次上游请求
+        task = self.inflight.get(key)
+        if task is None:
+            async def _run():
+                try:
+                    if self.disk is None:
+                        value = await fetcher()
+                        self.put(key, value)
+                        return value
+                    return await self._fetch_shared(key, fetcher, max_age)
+                finally:
+                    self.inflight.pop(key, None)
+            task = self.inflight[key] = asyncio.ensure_future(_run())
+        return await asyncio.shield(task)
+
+    async def _fetch_shared(self, key, fetcher, max_age):
+        # 先看其他分片是否已经抓过; 拿到文件锁后再确认一次, 仍没有才请求上游
+        fd = await self.disk.lock(key)
+        try:
+            entry = await run_io(self.disk.load, key)
+            if entry:
+                self.entries[key] = tuple(entry)
+                cached = self.get(key, max_age)
+                if cached is not None:
+                    metrics.inc('cache_requests_total', cache='shared_disk', result='hit')
+                    return cached
+            metrics.inc('cache_requests_total', cache='shared_disk', result='miss')
+            value = await fetcher()
+            self.put(key, value)
+            await run_io(self.disk.save, key, self.entries[key][0], value)
+            return value
+        finally:
+            self.disk.unlock(fd)
+
+data_cache = DataCache(SharedDiskCache(SHARED_CACHE_DIR))
+
+def week_days(date_str):
+    # date 所在自然周 (周一 ~ 周日)
+    d = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+    monday = d - datetime.timedelta(days=d.weekday())
+    return [(monday + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
+
+def _cached_events(date_str, min_importance, max_age):
+    # 低星级的缓存可覆盖高星级的请求
+    for imp in range(1, min_importance + 1):
+        cached = data_cache.get(('events', date_str, imp), max_age)
+        if cached is not None:
+            return filter_events(cached, min_importance)
+    return None
+
+async def _fetch_week_events(days, min_importance):
+    by_day = await fetch_us_events_range(days[0], days[-1], min_importance)
+    # 按天写入索引, 之后的单日推送/查询直接命中
+    for day in days:
+        data_cache.put(('events', day, min_importance), by_day.get(day, []))
+    return by_day
+
+async def prepare_week_events(date_str, min_importance=2, max_age=SERVE_MAX_AGE):
+    days = week_days(date_str)
+    cached = {day: _cached_events(day, min_importance, max_age) for day in days}
+    if all(v is not None for v in cached.values()):
+        return cached
+    # 整周只发一次 FMP 请求; key 用周日日期, 随整周一起过期
+    # 分片时统一按最低星级抓取, 保证各进程共用同一份磁盘缓存
+    fetch_imp = 1 if SHARD_COUNT else min_importance
+    by_day = await data_cache.get_or_fetch(
+        ('week_events', days[-1], fetch_imp), lambda: _fetch_week_events(days, fetch_imp), max_age
+    )
+    return {day: filter_events(by_day.get(day, []), min_importance) for day in days}
+
+async def prepare_events(date_str, min_importance=2, max_age=SERVE_MAX_AGE):
+    cached = _cached_events(date_str, min_importance, max_age)
+    if cached is not None:
+        return cached
+    # 周索引里这一天已过期: 只补抓这一天, 不重新拉取整周 (整周请求留给 /week 与周报)
+    fetch_imp = 1 if SHARD_COUNT else min_importance
+    evts = await data_cache.get_or_fetch(
+        ('events', date_str, fetch_imp), lambda: fetch_us_events(date_str, fetch_imp), max_age
+    )
+    return filter_events(evts, min_importance)
+
+async def _fetch_earnings_fresh(date_str):
+    # 已有名单时后台刷新, 推送不等 GitHub
+    if sp500_symbols: refresh_sp500_in_background()
+    return await fetch_earnings(date_str)
+
+async def prepare_earnings(date_str, max_age=SERVE_MAX_AGE):
+    return await data_cache.get_or_fetch(('earnings', date_str), lambda: _fetch_earnings_fresh(date_str), max_age)
+
+async def prepare_week_earnings(date_str, max_age=SERVE_MAX_AGE):
+    # 周一到周五并发请求, 结果按天进缓存
+    days = week_days(date_str)[:5]
+    results = await asyncio.gather(*(prepare_earnings(day, max_age) for day in days))
+    return dict(zip(days, results))
+
+def guild_min_importance():
+    return min((conf.get('min_importance', 2) for conf in settings.values()), default=2)
+
+async def prefetch(kind, date_str):
+    try:
+        if kind == 'evt':
+            await prepare_events(date_str, guild_min_importance(), PREFETCH_REFRESH_AGE)
+            log(f"📦 宏观数据已预取: {date_str}")
+        elif kind == 'wk':
+            await asyncio.gather(
+                prepare_week_events(date_str, guild_min_importance(), PREFETCH_REFRESH_AGE),
+                prepare_week_earnings(date_str, PREFETCH_REFRESH_AGE)
+            )
+            log(f"📦 周报数据已预取: {date_str}")
+        else:
+            await prepare_earnings(date_str, PREFETCH_REFRESH_AGE)
+            log(f"📦 财报数据已预取: {date_str}")
+    except Exception as e:
+        safe_print_error("预取失败", e)
+
+# ================== 10. 推送分发 (并发 + 限流 + 重试) ==================
+DELIVERY_CONCURRENCY = 10     # 同时推送的频道数
+GLOBAL_RATE_PER_SEC = 40      # Discord 全局上限 50 req/s, 留余量
+SEND_MAX_RETRIES = 4
+
+class GlobalRateLimiter:
+    # 令牌桶: 所有频道共享全局配额
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+global_limiter = GlobalRateLimiter(GLOBAL_RATE_PER_SEC)
+
+async def send_with_retry(ch, **kwargs):
+    return await call_with_retry(ch.send, 'channel_send', **kwargs)
+
+async def call_with_retry(fn, stage, **kwargs):
+    for attempt in range(SEND_MAX_RETRIES + 1):
+        await global_limiter.acquire()
+        try:
+            with metrics.stage(stage):
+                return await fn(**kwargs)
+        except (discord.Forbidden, discord.NotFound):
+            raise
+        except discord.RateLimited as e:
+            metrics.inc('discord_retries_total', reason='429')
+            last, delay = e, e.retry_after
+        except discord.HTTPException as e:
+            if e.status != 429 and e.status < 500: raise
+            metrics.inc('discord_retries_total', reason=str(e.status))
+            last, delay = e, getattr(e, 'retry_after', None) or 2 ** attempt
+        # except 块结束后已没有"当前异常", 最后一次要显式抛出保存的异常
+        if attempt == SEND_MAX_RETRIES: raise last
+        # 指数退避 + 抖动
+        await asyncio.sleep(delay + random.uniform(0, 0.5 * (attempt + 1)))
+
+async def fan_out(label, targets, on_result=None, on_sent=None):
+    # targets: [(gid, channel, [send kwargs, ...])]; on_result(gid, ok) 每个频道完成后回调
+    # on_sent(gid, page, message) 每条消息发出后回调 (记录消息 id 供之后编辑)
+    # 同一频道的消息顺序发送 (同一 route bucket), 不同频道并发
+    sem = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+    started = time.monotonic()
+    failed = 0
+
+    async def _deliver(gid, ch, payloads):
+        nonlocal failed
+        async with sem:
+            ok = True
+            try:
+                for page, kwargs in enumerate(payloads):
+                    msg = await send_with_retry(ch, **kwargs)
+                    if on_sent and msg is not None: on_sent(gid, page, msg)
+            except Exception as e:
+                ok = False
+                failed += 1
+                safe_print_error(f"推送失败 #{getattr(ch, 'id', '?')}", e)
+            if on_result: on_result(gid, ok)
+
+    await asyncio.gather(*(_deliver(gid, ch, payloads) for gid, ch, payloads in targets))
+    elapsed = time.monotonic() - started
+    metrics.observe('stage_seconds', elapsed, stage='fan_out')
+    metrics.inc('stage_calls_total', stage='fan_out')
+    metrics.inc('deliveries_total', len(targets) - failed, result='ok')
+    metrics.inc('deliveries_total', failed, result='failed')
+    log(f"📬 {label} 分发完成: {len(targets) - failed}/{len(targets)} 个频道, 耗时 {elapsed:.2f}s")
+    return elapsed
+
+# === 推送账本 (SQLite WAL, 替代 /data/*.lock) ===
+LEDGER_RETENTION_DAYS = 14
+DELIVERY_MAX_ATTEMPTS = 3         # 失败的推送在补发窗口内最多再试到第 3 次
+DELIVERY_RETRY_DELAY = 10 * 60
+
+class DeliveryLedger:
+    # 每个 (类型, 日期, 服务器) 一行: pending -> sent / failed (failed 在补发窗口内可重试)
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._claimed = set()  # 本进程正在发送的, 防止补发与续发重叠
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                "kind TEXT NOT NULL, date TEXT NOT NULL, guild_id INTEGER NOT NULL, "
+                "status TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (kind, date, guild_id)) WITHOUT ROWID"
+            )
+            if 'attempts' not in [r[1] for r in self._db.execute("PRAGMA table_info(deliveries)")]:
+                self._db.execute("ALTER TABLE deliveries ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            # 已发出的消息, 盘中更新时按页比对摘要, 只编辑有变化的
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "kind TEXT NOT NULL, date TEXT NOT NULL, guild_id INTEGER NOT NULL, page INTEGER NOT NULL, "
+                "channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, digest TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (kind, date, guild_id, page)) WITHOUT ROWID"
+            )
+            self.prune()
+            self._import_lock_files()
+        return self._db
+
+    def _import_lock_files(self):
+        # 旧版锁文件 (/data/evt_日期.lock) 表示当天已推送: 先记为全部服务器已发送再删除, 避免升级后重复补发
+        paths = glob.glob('/data/evt_*.lock') + glob.glob('/data/ern_*.lock')
+        if not paths: return
+        try:
+            # 分片共用账本, 按设置文件里的全部服务器导入, 而不只是本进程负责的
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                gids = [int(k) for k in json.load(f)]
+        except (OSError, ValueError):
+            gids = list(settings)
+        rows = []
+        for path in paths:
+            kind, _, date_str = os.path.basename(path)[:-len('.lock')].partition('_')
+            try: updated_at = os.path.getmtime(path)
+            except OSError: continue
+            rows += [(kind, date_str, gid, updated_at) for gid in gids]
+        self._db.executemany(
+            "INSERT OR IGNORE INTO deliveries (kind, date, guild_id, status, updated_at) VALUES (?, ?, ?, 'sent', ?)", rows
+        )
+        self._db.commit()
+        for path in paths:
+            try: os.remove(path)
+            except OSError: pass
+        log(f"已导入旧版推送锁文件: {len(paths)} 个")
+
+    def status(self, kind, date_str, gid):
+        row = self._conn().execute(
+            "SELECT status FROM deliveries WHERE kind = ? AND date = ? AND guild_id = ?", (kind, date_str, gid)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _due(self, kind, date_str, gid, now):
+        # pending, 或补发窗口内、重试次数未用完的 failed
+        row = self._conn().execute(
+            "SELECT status, attempts, updated_at FROM deliveries WHERE kind = ? AND date = ? AND guild_id = ?",
+            (kind, date_str, gid)
+        ).fetchone()
+        if not row: return False
+        status, attempts, updated_at = row
+        return status == 'pending' or (
+            status == 'failed' and attempts < DELIVERY_MAX_ATTEMPTS and updated_at >= now - CATCHUP_WINDOW
+        )
+
+    def begin(self, kind, date_str, gids):
+        # 记录待发送, 返回本次需要发送的服务器 (已发送/正在发送/重试次数用完的跳过)
+        db = self._conn()
+        now = time.time()
+        db.executemany(
+            "INSERT OR IGNORE INTO deliveries (kind, date, guild_id, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+            [(kind, date_str, gid, now) for gid in gids]
+        )
+        db.commit()
+        todo = []
+        for gid in gids:
+            if (kind, date_str, gid) in self._claimed: continue
+            if self._due(kind, date_str, gid, now):
+                self._claimed.add((kind, date_str, gid))
+                todo.append(gid)
+        return todo
+
+    def mark(self, kind, date_str, gid, ok):
+        db = self._conn()
+        db.execute(
+            "UPDATE deliveries SET status = ?, updated_at = ?, attempts = attempts + ? "
+            "WHERE kind = ? AND date = ? AND guild_id = ?",
+            ('sent' if ok else 'failed', time.time(), 0 if ok else 1, kind, date_str, gid)
+        )
+        db.commit()
+        self._claimed.discard((kind, date_str, gid))
+
+    def release(self, kind, date_str, gids):
+        for gid in gids: self._claimed.discard((kind, date_str, gid))
+
+    def save_message(self, kind, date_str, gid, page, channel_id, message_id, digest):
+        db = self._conn()
+        db.execute(
+            "INSERT OR REPLACE INTO messages (kind, date, guild_id, page, channel_id, message_id, digest, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (kind, date_str, gid, page, channel_id, message_id, digest, time.time())
+        )
+        db.commit()
+
+    def update_digest(self, kind, date_str, gid, page, digest):
+        db = self._conn()
+        db.execute(
+            "UPDATE messages SET digest = ?, updated_at = ? WHERE kind = ? AND date = ? AND guild_id = ? AND page = ?",
+            (digest, time.time(), kind, date_str, gid, page)
+        )
+        db.commit()
+
+    def forget_message(self, kind, date_str, gid, page):
+        db = self._conn()
+        db.execute("DELETE FROM messages WHERE kind = ? AND date = ? AND guild_id = ? AND page = ?", (kind, date_str, gid, page))
+        db.commit()
+
+    def messages(self, kind, date_str):
+        # {gid: [(page, channel_id, message_id, digest), ...]}
+        rows = self._conn().execute(
+            "SELECT guild_id, page, channel_id, message_id, digest FROM messages WHERE kind = ? AND date = ? ORDER BY page",
+            (kind, date_str)
+        ).fetchall()
+        out = {}
+        for gid, *page in rows:
+            out.setdefault(gid, []).append(tuple(page))
+        return out
+
+    def message_dates(self, kind, max_age):
+        rows = self._conn().execute(
+            "SELECT DISTINCT date FROM messages WHERE kind = ? AND updated_at >= ?", (kind, time.time() - max_age)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def retryable(self, kind, date_str, gids):
+        now = time.time()
+        return [gid for gid in gids if self.status(kind, date_str, gid) == 'failed' and self._due(kind, date_str, gid, now)]
+
+    def unfinished(self, max_age):
+        # 中途退出留下的 pending, 以及还能重试的 failed
+        rows = self._conn().execute(
+            "SELECT kind, date, guild_id FROM deliveries WHERE updated_at >= ? "
+            "AND (status = 'pending' OR (status = 'failed' AND attempts < ?))",
+            (time.time() - max_age, DELIVERY_MAX_ATTEMPTS)
+        ).fetchall()
+        groups = {}
+        for kind, date_str, gid in rows:
+            groups.setdefault((kind, date_str), []).append(gid)
+        return groups
+
+    def prune(self):
+        db = self._conn()
+        cutoff = time.time() - LEDGER_RETENTION_DAYS * 86400
+        db.execute("DELETE FROM deliveries WHERE updated_at < ?", (cutoff,))
+        db.execute("DELETE FROM messages WHERE updated_at < ?", (cutoff,))
+        db.commit()
+
+ledger = DeliveryLedger(LEDGER_DB)
+
+# ================== 11. 定时任务 (最小堆调度) ==================
+DEFAULT_TZ = 'Asia/Shanghai'
+PUSH_TIME_KEYS = {'evt': 'event_time', 'ern': 'earnings_time', 'wk': 'event_time'}
+DEFAULT_PUSH_TIMES = {'evt': '08:00', 'ern': '20:00', 'wk': '08:00'}
+SLOT_PERIOD_DAYS = {'evt': 1, 'ern': 1, 'wk': 7}   # 周报只在周一推送
+CATCHUP_WINDOW = 6 * 3600     # 重启后补发 6 小时内错过的推送
+HEARTBEAT_INTERVAL = 5 * 60
+MAX_SLEEP = 3600              # 防止系统时钟跳变, 最长睡 1 小时后重新校准
+
+class JobScheduler:
+    # 堆元素: (触发时间戳, gen, key); 同一 key 重新调度后旧元素按 gen 惰性失效
+    def __init__(self):
+        self.heap = []
+        self.jobs = {}
+        self._gen = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def schedule(self, key, fire_at, coro_fn):
+        gen = next(self._gen)
+        self.jobs[key] = (gen, coro_fn)
+        heapq.heappush(self.heap, (fire_at, gen, key))
+        self._wakeup.set()
+
+    def cancel(self, key):
+        self.jobs.pop(key, None)
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self.heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            fire_at, gen, key = self.heap[0]
+            delay = fire_at - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError: pass
+                continue
+            heapq.heappop(self.heap)
+            job = self.jobs.get(key)
+            if not job or job[0] != gen: continue
+            del self.jobs[key]
+            asyncio.create_task(self._fire(key, job[1]))
+
+    async def _fire(self, key, coro_fn):
+        try:
+            await coro_fn()
+        except Exception as e:
+            safe_print_error(f"任务失败 {key}", e)
+
+scheduler = JobScheduler()
+active_slots = set()
+
+def guild_kinds(conf):
+    return [kind for kind in PUSH_TIME_KEYS if kind != 'wk' or conf.get('weekly_digest')]
+
+def guild_slot(conf, kind):
+    # (类型, 时区, HH:MM); 同一时刻的服务器合并成一个任务
+    return (kind, conf.get('timezone', DEFAULT_TZ), conf.get(PUSH_TIME_KEYS[kind], DEFAULT_PUSH_TIMES[kind]))
+
+def slot_occurrence(slot, ref, offset_days=0):
+    kind, tz_name, hhmm = slot
+    tz = pytz.timezone(tz_name)
+    h, m = map(int, hhmm.split(':'))
+    day = ref.astimezone(tz).date() + datetime.timedelta(days=offset_days)
+    if kind == 'wk': day -= datetime.timedelta(days=day.weekday())
+    return tz.localize(datetime.datetime.combine(day, datetime.time(h, m)))
+
+def push_date(kind, fire_dt):
+    # 宏观推当天, 财报推次日
+    day = fire_dt.date() + datetime.timedelta(days=1 if kind == 'ern' else 0)
+    return day.strftime("%Y-%m-%d")
+
+def schedule_slot(slot, catch_up=False):
+    now = datetime.datetime.now(UTC)
+    fire_dt = slot_occurrence(slot, now)
+    if fire_dt <= now:
+        prev, fire_dt = fire_dt, slot_occurrence(slot, now, SLOT_PERIOD_DAYS[slot[0]])
+        # 补发: 已发送的服务器由账本过滤
+        if catch_up and (now - prev).total_seconds() <= CATCHUP_WINDOW:
+            scheduler.schedule(('catchup',) + slot, time.time(), lambda: run_slot(slot, prev, reschedule=False))
+
+    fire_at = fire_dt.timestamp()
+    scheduler.schedule(('push',) + slot, fire_at, lambda: run_slot(slot, fire_dt))
+    date_str = push_date(slot[0], fire_dt)
+    for lead in (PREFETCH_LEAD, PREFETCH_FINAL_LEAD):
+        if fire_at - lead > time.time():
+            scheduler.schedule(('prefetch', slot[0], date_str, fire_at - lead), fire_at - lead, lambda: prefetch(slot[0], date_str))
+    active_slots.add(slot)
+
+def sync_slots(catch_up=False):
+    desired = {guild_slot(conf, kind) for gid, conf in settings.items() if owns_guild(gid) for kind in guild_kinds(conf)}
+    for slot in active_slots - desired:
+        scheduler.cancel(('push',) + slot)
+        active_slots.discard(slot)
+    for slot in desired - active_slots:
+        schedule_slot(slot, catch_up)
+
+async def run_slot(slot, fire_dt, reschedule=True):
+    kind = slot[0]
+    if reschedule and slot in active_slots:
+        active_slots.discard(slot)
+        schedule_slot(slot)
+    gids = [gid for gid, conf in settings.items()
+            if owns_guild(gid) and kind in guild_kinds(conf) and guild_slot(conf, kind) == slot]
+    await deliver(kind, push_date(kind, fire_dt), gids)
+
+async def deliver(kind, date_str, gids):
+    # 账本读写都在 io 线程里串行执行, 不阻塞事件循环
+    todo = await run_io(ledger.begin, kind, date_str, gids)
+    if not todo: return
+    try:
+        if kind == 'evt':
+            await push_events(date_str, todo)
+        elif kind == 'wk':
+            await push_week(date_str, todo)
+        else:
+            await push_earnings(date_str, todo)
+    finally:
+        ledger.release(kind, date_str, todo)
+        io_executor.submit(ledger.prune)
+    # 临时故障 (Discord 5xx / 频道暂时解析不到): 稍后只对失败的服务器重试
+    retry = await run_io(ledger.retryable, kind, date_str, todo)
+    if retry:
+        log(f"🔁 {kind} {date_str}: {len(retry)} 个服务器推送失败, {DELIVERY_RETRY_DELAY // 60} 分钟后重试")
+        scheduler.schedule(('retry', kind, date_str, tuple(retry)), time.time() + DELIVERY_RETRY_DELAY,
+                           lambda: deliver(kind, date_str, retry))
+
+def mark_delivery(kind, date_str, gid, ok):
+    io_executor.submit(ledger.mark, kind, date_str, gid, ok)
+
+def _resolve_targets(kind, date_str, gids):
+    # 频道不存在/服务器已关闭推送的记为失败, 在重试次数内稍后再试
+    targets = []
+    for gid in gids:
+        ch = bot.get_channel(settings[gid].get('channel_id')) if gid in settings else None
+        if ch: targets.append((gid, ch))
+        else: mark_delivery(kind, date_str, gid, False)
+    return targets
+
+async def push_events(date_str, gids):
+    log(f"🚀 推送宏观: {date_str} ({len(gids)} 个服务器)")
+    targets = _resolve_targets('evt', date_str, gids)
+    if not targets: return
+    imps = {gid: settings[gid].get('min_importance', 2) for gid, _ in targets}
+    # 全部服务器共用一次抓取 + 翻译
+    all_evts = await prepare_events(date_str, min(imps.values()))
+    rendered = {imp: calendar_payloads(all_evts, date_str, imp) for imp in set(imps.values())}
+    digests = {imp: [payload_digest(p) for p in payloads] for imp, payloads in rendered.items()}
+
+    def on_sent(gid, page, msg):
+        io_executor.submit(ledger.save_message, 'evt', date_str, gid, page, msg.channel.id, msg.id, digests[imps[gid]][page])
+
+    await fan_out(f"宏观 {date_str}", [(gid, ch, rendered[imps[gid]]) for gid, ch in targets],
+                  on_result=lambda gid, ok: mark_delivery('evt', date_str, gid, ok), on_sent=on_sent)
+    schedule_actual_polls(date_str, all_evts)
+
+async def push_earnings(date_str, gids):
+    log(f"🚀 推送财报: {date_str} ({len(gids)} 个服务器)")
+    targets = _resolve_targets('ern', date_str, gids)
+    if not targets: return
+    data = await prepare_earnings(date_str)
+    embed = format_earnings_embed(data, date_str)
+    if not embed:
+        for gid, _ in targets: mark_delivery('ern', date_str, gid, True)
+        return
+    payloads = pack_embeds([embed])
+    await fan_out(f"财报 {date_str}", [(gid, ch, payloads) for gid, ch in targets],
+                  on_result=lambda gid, ok: mark_delivery('ern', date_str, gid, ok))
+
+async def push_week(date_str, gids):
+    log(f"🚀 推送周报: {date_str} ({len(gids)} 个服务器)")
+    targets = _resolve_targets('wk', date_str, gids)
+    if not targets: return
+    imps = {gid: settings[gid].get('min_importance', 2) for gid, _ in targets}
+    events_by_day, earnings_by_day = await asyncio.gather(
+        prepare_week_events(date_str, min(imps.values())), prepare_week_earnings(date_str)
+    )
+    rendered = {
+        imp: pack_embeds([format_week_embed({d: filter_events(e, imp) for d, e in events_by_day.items()}, earnings_by_day, date_str)])
+        for imp in set(imps.values())
+    }
+    await fan_out(f"周报 {date_str}", [(gid, ch, rendered[imps[gid]]) for gid, ch in targets],
+                  on_result=lambda gid, ok: mark_delivery('wk', date_str, gid, ok))
+
+async def resume_unfinished():
+    # 上次进程在分发中途退出: 继续给还没收到的服务器发送
+    for (kind, date_str), gids in (await run_io(ledger.unfinished, CATCHUP_WINDOW)).items():
+        gids = [gid for gid in gids if owns_guild(gid)]
+        if not gids: continue
+        log(f"⏯️ 续发未完成的推送: {kind} {date_str} ({len(gids)} 个服务器)")
+        await deliver(kind, date_str, gids)
+
+# === 盘中公布值更新: 按当天各项数据的公布时间轮询, 只编辑内容有变化的消息 ===
+ACTUAL_POLL_OFFSETS = (90, 5 * 60, 15 * 60)   # 公布后 1.5 / 5 / 15 分钟各查一次
+ACTUALS_MAX_AGE = 45                          # 同一时刻的多个轮询 (含其他分片) 共用一次抓取
+ACTUALS_WINDOW = 86400                        # 只跟踪 24 小时内推送过的日历
+ACTUAL_EDIT_RETRIES = 3                       # 编辑失败后单独重试的次数
+ACTUAL_EDIT_RETRY_DELAY = 5 * 60
+_actuals_seen = {}                            # date -> (记录时间, {(标题, 公布时间): 公布值})
+
+def actuals_snapshot(events):
+    return {(e['orig_title'], e['bjt_timestamp'].timestamp()): e.get('actual', '') for e in events if not is_speech(e)}
+
+def schedule_actual_polls(date_str, events):
+    now = time.time()
+    for released_at in sorted({t for (_, t), actual in actuals_snapshot(events).items() if not actual}):
+        for offset in ACTUAL_POLL_OFFSETS:
+            fire_at = released_at + offset
+            if fire_at > now:
+                scheduler.schedule(('actuals', date_str, fire_at), fire_at, lambda r=released_at: refresh_actuals(date_str, r))
+
+async def _fetch_live_events(date_str):
+    evts = await fetch_us_events(date_str, 1)
+    # 顺便刷新单日索引, 斜杠命令也能看到最新公布值
+    if evts: data_cache.put(('events', date_str, 1), evts)
+    return evts
+
+async def prepare_live_events(date_str):
+    return await data_cache.get_or_fetch(('live_events', date_str), lambda: _fetch_live_events(date_str), ACTUALS_MAX_AGE)
+
+def prune_actuals_seen():
+    cutoff = time.time() - ACTUALS_WINDOW
+    for date_str in [d for d, (ts, _) in _actuals_seen.items() if ts < cutoff]:
+        del _actuals_seen[date_str]
+
+async def refresh_actuals(date_str, released_at=None, attempt=0):
+    seen = _actuals_seen.get(date_str, (0, None))[1]
+    # 上次轮询已拿到这一批的公布值: 不再请求上游
+    if seen is not None and released_at is not None and \
+            all(actual for (_, t), actual in seen.items() if t == released_at):
+        return
+    stored = await run_io(ledger.messages, 'evt', date_str)
+    stored = {gid: pages for gid, pages in stored.items() if owns_guild(gid) and gid in settings}
+    if not stored: return
+
+    all_evts = await prepare_live_events(date_str)
+    if not all_evts: return
+    current = actuals_snapshot(all_evts)
+    # 首次轮询 (含重启后) 没有基准, 直接按消息摘要比对
+    if seen is not None:
+        changed = {k for k, v in current.items() if v != seen.get(k)}
+        if not changed: return
+        changed_imp = max(e['_imp'] for e in all_evts if (e['orig_title'], e['bjt_timestamp'].timestamp()) in changed)
+    else:
+        changed_imp = 3
+
+    rendered = {}
+    edits, extra = [], []
+    for gid, pages in stored.items():
+        imp = settings[gid].get('min_importance', 2)
+        if changed_imp < imp: continue  # 变化的事件不在该服务器的星级范围内
+        if imp not in rendered:
+            payloads = calendar_payloads(all_evts, date_str, imp)
+            rendered[imp] = (payloads, [payload_digest(p) for p in payloads])
+        payloads, digests = rendered[imp]
+        for page, channel_id, message_id, digest in pages:
+            if page < len(payloads) and digests[page] != digest:
+                edits.append((gid, page, channel_id, message_id, payloads[page], digests[page]))
+        # 内容变长导致多出一页: 补发
+        if pages and len(payloads) > len(pages):
+            extra.append((gid, pages[0][1], len(pages), payloads[len(pages):], digests[len(pages):]))
+    if not edits and not extra:
+        _actuals_seen[date_str] = (time.time(), current)
+        return
+
+    sem = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+
+    async def _edit(gid, page, channel_id, message_id, payload, digest):
+        ch = bot.get_channel(channel_id)
+        if not ch: return True
+        async with sem:
+            try:
+                await call_with_retry(ch.get_partial_message(message_id).edit, 'message_edit', **payload)
+                io_executor.submit(ledger.update_digest, 'evt', date_str, gid, page, digest)
+            except discord.NotFound:
+                io_executor.submit(ledger.forget_message, 'evt', date_str, gid, page)
+            except Exception as e:
+                safe_print_error(f"编辑消息失败 #{channel_id}", e)
+                return False
+        return True
+
+    async def _append(gid, channel_id, first_page, payloads, digests):
+        ch = bot.get_channel(channel_id)
+        if not ch: return True
+        async with sem:
+            try:
+                for i, payload in enumerate(payloads):
+                    msg = await send_with_retry(ch, **payload)
+                    if msg is not None:
+                        io_executor.submit(ledger.save_message, 'evt', date_str, gid, first_page + i, channel_id, msg.id, digests[i])
+            except Exception as e:
+                safe_print_error(f"补发分页失败 #{channel_id}", e)
+                return False
+        return True
+
+    results = await asyncio.gather(*(_edit(*e) for e in edits), *(_append(*a) for a in extra))
+    if all(results):
+        _actuals_seen[date_str] = (time.time(), current)
+    else:
+        # 有消息没改成功: 不记录快照, 下次轮询按摘要重新比对; 当天最后一批之后没有轮询, 单独安排重试
+        _actuals_seen.pop(date_str, None)
+        if attempt < ACTUAL_EDIT_RETRIES:
+            scheduler.schedule(('actuals_retry', date_str), time.time() + ACTUAL_EDIT_RETRY_DELAY,
+                               lambda: refresh_actuals(date_str, attempt=attempt + 1))
+    edited = sum(results[:len(edits)])
+    metrics.inc('message_edits_total', edited)
+    log(f"✏️ 公布值更新 {date_str}: 编辑 {edited}/{len(edits)} 条消息, 补发 {len(extra)} 个频道")
+
+async def resume_actual_polls():
+    # 重启后: 对近期已推送的日历恢复轮询, 并立即检查一次错过的公布值
+    for date_str in await run_io(ledger.message_dates, 'evt', ACTUALS_WINDOW):
+        await refresh_actuals(date_str)
+        evts = _cached_events(date_str, 1, SERVE_MAX_AGE) or await prepare_live_events(date_str)
+        schedule_actual_polls(date_str, evts)
+
+async def heartbeat():
+    shards = f" | 分片: {SHARD_ID_LIST or 'all'}/{SHARD_COUNT}" if SHARD_COUNT else ""
+    log(f"💓 [系统心跳] Bot 运行正常 | 时间: {datetime.datetime.now(BJT).strftime('%H:%M')} | 待执行任务: {len(scheduler.jobs)}{shards}")
+    io_executor.submit(data_cache.disk.prune, time.time() - 7 * 86400)
+    io_executor.submit(prune_last_good, time.time() - LKG_RETENTION_DAYS * 86400)
+    prune_actuals_seen()
+    schedule_heartbeat()
+
+def schedule_heartbeat():
+    now = time.time()
+    scheduler.schedule(('heartbeat',), now - now % HEARTBEAT_INTERVAL + HEARTBEAT_INTERVAL, heartbeat)
+
+def _read_text(path):
+    if not os.path.exists(path): return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def commands_digest():
+    payload = sorted((cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()), key=lambda c: c['name'])
+    raw = json.dumps({'app': bot.application_id, 'commands': payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+async def sync_commands_if_changed():
+    # 命令定义没变就不 sync (sync 慢且受 Discord 限流)
+    try:
+        digest = commands_digest()
+        if await run_io(_read_text, COMMANDS_HASH_FILE) == digest:
+            return
+        await bot.tree.sync()
+        writer.write(COMMANDS_HASH_FILE, digest)
+        log("✅ 斜杠命令已同步")
+    except Exception as e:
+        safe_print_error("命令同步失败", e)
 
 @bot.event
 async def on_ready():
-    load_settings()
     log(f'✅ Bot 已登录: {bot.user}')
-    await bot.tree.sync()
-    await update_sp500_list()
-    if not main_loop.is_running(): main_loop.start()
+    if scheduler.is_running(): return  # 断线重连不重复初始化
+    scheduler.schedule(('resume',), time.time(), resume_unfinished)
+    scheduler.schedule(('resume_actuals',), time.time(), resume_actual_polls)
+    sync_slots(catch_up=True)
+    schedule_heartbeat()
+    scheduler.start()
+    # 以下都在后台完成, 不阻塞就绪
+    asyncio.create_task(sync_commands_if_changed())
+    refresh_sp500_in_background()
+    if translation_configured(): asyncio.create_task(run_translate(get_translate_client))
 
-# ================== 10. 命令 ==================
+# ================== 12. 命令 ==================
 @bot.tree.command(name="set_channel", description="设置推送频道")
 async def set_channel(interaction: discord.Interaction):
     gid = interaction.guild_id
     if gid not in settings: settings[gid] = {}
     settings[gid]['channel_id'] = interaction.channel_id
     save_settings()
+    sync_slots()
     await interaction.response.send_message(f"✅ 绑定成功", ephemeral=True)
 
 @bot.tree.command(name="test_earnings", description="测试财报")
 async def test_earnings(interaction: discord.Interaction, date: str = None):
+    if date:
+        try:
+            date = datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            await interaction.response.send_message(f"❌ 无效日期: {date} (例: 2025-01-31)", ephemeral=True)
+            return
     await interaction.response.defer()
     if not date: date = (datetime.datetime.now(BJT) + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    stocks = await fetch_earnings(date)
+    stocks = await prepare_earnings(date, COMMAND_CACHE_TTL)
     embed = format_earnings_embed(stocks, date)
     if embed: await interaction.followup.send(embed=embed)
     else: await interaction.followup.send(f"📅 **{date}** 无重点财报", ephemeral=True)
@@ -500,10 +2187,31 @@ async def test_earnings(interaction: discord.Interaction, date: str = None):
 async def test_push(interaction: discord.Interaction):
     await interaction.response.defer()
     today = datetime.datetime.now(BJT).strftime("%Y-%m-%d")
-    evts = await fetch_us_events(today, 2)
-    embed_list = format_calendar_embed(evts, today, 2)
-    for em in embed_list:
-        await interaction.followup.send(embed=em)
+    evts = await prepare_events(today, 2, COMMAND_CACHE_TTL)
+    for payload in calendar_payloads(evts, today, 2):
+        await interaction.followup.send(**payload)
+
+@bot.tree.command(name="week", description="本周宏观日历与财报前瞻")
+async def week(interaction: discord.Interaction):
+    await interaction.response.defer()
+    now = datetime.datetime.now(BJT)
+    # 周末查看下一周
+    if now.weekday() >= 5: now += datetime.timedelta(days=7 - now.weekday())
+    date_str = now.strftime("%Y-%m-%d")
+    imp = settings.get(interaction.guild_id, {}).get('min_importance', 2)
+    events_by_day, earnings_by_day = await asyncio.gather(
+        prepare_week_events(date_str, imp, COMMAND_CACHE_TTL), prepare_week_earnings(date_str, COMMAND_CACHE_TTL)
+    )
+    await interaction.followup.send(embed=format_week_embed(events_by_day, earnings_by_day, date_str))
+
+@bot.tree.command(name="set_weekly_digest", description="开启/关闭每周一的周报推送")
+async def set_weekly_digest(interaction: discord.Interaction, enabled: bool):
+    gid = interaction.guild_id
+    if gid not in settings: settings[gid] = {}
+    settings[gid]['weekly_digest'] = enabled
+    save_settings()
+    sync_slots()
+    await interaction.response.send_message("✅ 已开启周一周报" if enabled else "🚫 已关闭周一周报", ephemeral=True)
 
 @bot.tree.command(name="set_importance", description="设置宏观事件最低星级")
 @discord.app_commands.choices(level=[
@@ -518,12 +2226,41 @@ async def set_importance(interaction: discord.Interaction, level: discord.app_co
     save_settings()
     await interaction.response.send_message(f"✅ 最低星级设为 {level.name}", ephemeral=True)
 
+@bot.tree.command(name="set_schedule", description="设置推送时间与时区")
+async def set_schedule(interaction: discord.Interaction, timezone: str = None, event_time: str = None, earnings_time: str = None):
+    if timezone and timezone not in pytz.all_timezones_set:
+        await interaction.response.send_message(f"❌ 无效时区: {timezone} (例: Asia/Shanghai)", ephemeral=True)
+        return
+    for t in (event_time, earnings_time):
+        if t and not re.match(r'^([01]\d|2[0-3]):[0-5]\d$', t):
+            await interaction.response.send_message(f"❌ 时间格式应为 HH:MM: {t}", ephemeral=True)
+            return
+    gid = interaction.guild_id
+    if gid not in settings: settings[gid] = {}
+    conf = settings[gid]
+    if timezone: conf['timezone'] = timezone
+    if event_time: conf['event_time'] = event_time
+    if earnings_time: conf['earnings_time'] = earnings_time
+    save_settings()
+    sync_slots()
+    await interaction.response.send_message(
+        f"✅ 时区 {conf.get('timezone', DEFAULT_TZ)} | 宏观 {conf.get('event_time', DEFAULT_PUSH_TIMES['evt'])} | 财报 {conf.get('earnings_time', DEFAULT_PUSH_TIMES['ern'])}",
+        ephemeral=True
+    )
+
+@bot.tree.command(name="metrics", description="查看推送流水线各阶段耗时")
+async def metrics_summary(interaction: discord.Interaction):
+    lines = metrics.summary() or ["暂无数据"]
+    embed = discord.Embed(title="📈 运行指标", description="\n".join(lines)[:4000], color=0x3498db)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="disable_push", description="关闭本服务器推送")
 async def disable_push(interaction: discord.Interaction):
     gid = interaction.guild_id
     if gid in settings:
         del settings[gid]
         save_settings()
+        sync_slots()
         await interaction.response.send_message("🚫 已关闭本服务器推送", ephemeral=True)
     else:
         await interaction.response.send_message("本服务器未开启推送", ephemeral=True)